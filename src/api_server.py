@@ -3,24 +3,43 @@ Gemini Business Refresh Service API
 
 Provides HTTP API for account registration and cookie refresh.
 Designed to be called by the panel service.
+
+Workload note: a register/refresh job spends its time waiting on the
+network (Clash probes, DuckMail polling, Playwright page loads), not on
+Python CPU. It is I/O-bound, so jobs scale with async tasks and threads
+rather than process pools. /api/metrics exports per-stage timings and
+process CPU time to keep checking that assumption.
 """
 
 import asyncio
-import uuid
+import secrets
 import os
+import random
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional, Dict, List
+from itertools import islice
+from typing import TYPE_CHECKING, Optional, Dict, List
 from enum import Enum
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, ConfigDict, TypeAdapter, field_serializer
+
+from .config import get_config
+from .utils import logger, update_accounts_json_many, append_many_to_csv
+
+# Heavy modules (Playwright, Clash process control, mail client) are
+# imported where they are first used to keep worker start-up light.
+if TYPE_CHECKING:
+    from .clash_manager import ClashManager
+    from .browser_controller import SharedBrowser
 
-from .config import config
-from .utils import logger, update_accounts_json, append_to_csv
-from .clash_manager import ClashManager
-from .mail_client import MailClient
-from .browser_controller import BrowserController
+# The server reads its settings at import (task store sizing, workers)
+config = get_config()
 
 
 # ============ Models ============
@@ -33,13 +52,23 @@ class TaskStatus(str, Enum):
 
 
 class TaskInfo(BaseModel):
+    # Jobs update status/progress in place; keep assignments unvalidated
+    model_config = ConfigDict(validate_assignment=False)
+    
     task_id: str
     status: TaskStatus
-    created_at: str
-    completed_at: Optional[str] = None
+    created_at: float
+    completed_at: Optional[float] = None
     result: Optional[Dict] = None
     error: Optional[str] = None
     progress: Optional[Dict] = None
+    
+    @field_serializer("created_at", "completed_at")
+    def _format_timestamp(self, value: Optional[float]) -> Optional[str]:
+        """Timestamps are stored as epoch seconds and formatted on output."""
+        if value is None:
+            return None
+        return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S")
 
 
 class RegisterRequest(BaseModel):
@@ -51,11 +80,69 @@ class RefreshRequest(BaseModel):
     password: str
 
 
+_task_list_adapter = TypeAdapter(List[TaskInfo])
+
+
+# ============ Metrics ============
+
+class StageMetrics:
+    """Per-stage duration histograms, rendered in Prometheus text format."""
+    
+    BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+    
+    def __init__(self):
+        self._buckets: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+    
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record one duration for a stage."""
+        buckets = self._buckets.setdefault(stage, [0] * len(self.BUCKETS))
+        for idx, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                buckets[idx] += 1
+        self._sums[stage] = self._sums.get(stage, 0.0) + seconds
+        self._counts[stage] = self._counts.get(stage, 0) + 1
+    
+    async def timed(self, stage: str, awaitable):
+        """Await `awaitable` and record how long it took under `stage`."""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    def render(self) -> str:
+        """Render all histograms plus process CPU time."""
+        name = "gemini_refresh_stage_seconds"
+        lines = [
+            f"# HELP {name} Duration of account job stages.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, buckets in self._buckets.items():
+            for bound, count in zip(self.BUCKETS, buckets):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {self._counts[stage]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {self._sums[stage]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {self._counts[stage]}')
+        
+        lines += [
+            "# HELP process_cpu_seconds_total Total user and system CPU time spent in seconds.",
+            "# TYPE process_cpu_seconds_total counter",
+            f"process_cpu_seconds_total {time.process_time():.6f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+
+
 # ============ App ============
 
 app = FastAPI(
     title="Gemini Business Refresh Service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -65,41 +152,285 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress task listings and status payloads (cookie data is large JSON)
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
+
+# ============ Task Store ============
+
+class TaskStore:
+    """
+    Bounded in-memory task storage.
+    
+    Tasks are kept in insertion order, which is also creation order, so
+    listing recent tasks walks the tail instead of sorting every task.
+    Finished tasks are evicted after a TTL, and the oldest finished task
+    is dropped when the store is full.
+    """
+    
+    TERMINAL_STATUSES = (TaskStatus.SUCCESS, TaskStatus.FAILED)
+    
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._tasks: "OrderedDict[str, TaskInfo]" = OrderedDict()
+        # Per-task change events for long-polling / WebSocket subscribers
+        self._events: Dict[str, asyncio.Event] = {}
+    
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._tasks
+    
+    def __len__(self) -> int:
+        return len(self._tasks)
+    
+    def get(self, task_id: str) -> Optional[TaskInfo]:
+        return self._tasks.get(task_id)
+    
+    def save(self, task: TaskInfo) -> None:
+        """Insert or replace a task, making room if the store is full."""
+        if task.task_id not in self._tasks and len(self._tasks) >= self.capacity:
+            self._drop_oldest()
+        self._tasks[task.task_id] = task
+    
+    def notify(self, task_id: str) -> None:
+        """Wake everyone waiting for a change on this task."""
+        event = self._events.pop(task_id, None)
+        if event:
+            event.set()
+    
+    def change_event(self, task_id: str) -> asyncio.Event:
+        """Event set by the next notify() for this task."""
+        return self._events.setdefault(task_id, asyncio.Event())
+    
+    async def wait_for_change(
+        self,
+        task_id: str,
+        timeout: float,
+        event: Optional[asyncio.Event] = None
+    ) -> bool:
+        """
+        Wait until the task is updated via notify().
+        
+        Args:
+            task_id: Task to watch
+            timeout: Maximum wait time in seconds
+            event: Event from change_event() taken before the caller last
+                read the task, so a notify() in between is not missed
+        
+        Returns:
+            True if the task changed, False on timeout
+        """
+        if event is None:
+            event = self.change_event(task_id)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    def list(self, limit: int = 20) -> List[TaskInfo]:
+        """Return up to `limit` tasks, newest first."""
+        return list(islice(reversed(self._tasks.values()), max(limit, 0)))
+    
+    def evict_expired(self, ttl: int) -> int:
+        """
+        Remove finished tasks completed more than `ttl` seconds ago.
+        
+        Returns:
+            Number of evicted tasks
+        """
+        cutoff = time.time() - ttl
+        expired = [
+            task_id for task_id, task in self._tasks.items()
+            if task.status in self.TERMINAL_STATUSES
+            and task.completed_at is not None
+            and task.completed_at < cutoff
+        ]
+        
+        for task_id in expired:
+            del self._tasks[task_id]
+            self.notify(task_id)
+        return len(expired)
+    
+    def _drop_oldest(self) -> None:
+        """Drop the oldest finished task, or the oldest task if none finished."""
+        for task_id, task in self._tasks.items():
+            if task.status in self.TERMINAL_STATUSES:
+                del self._tasks[task_id]
+                self.notify(task_id)
+                return
+        task_id, _ = self._tasks.popitem(last=False)
+        self.notify(task_id)
+
+
+async def run_eviction_loop(store: TaskStore, interval: int = 60, ttl: int = 3600):
+    """Periodically evict finished tasks older than `ttl` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        evicted = store.evict_expired(ttl)
+        if evicted:
+            logger.info("[API] Evicted %s expired tasks", evicted)
+
+
 # Task storage (in-memory)
-tasks: Dict[str, TaskInfo] = {}
+tasks = TaskStore(capacity=config.task_store_capacity)
+
+# Clash manager (singleton), started in the background at startup
+clash_manager: Optional["ClashManager"] = None
+clash_state = "starting"  # starting | ready | failed
+clash_started = asyncio.Event()
+_clash_boot_task: Optional[asyncio.Task] = None
+
+# Long-lived browser reused across accounts (BROWSER_SHARED)
+shared_browser: Optional["SharedBrowser"] = None
+
+# Registration retry tuning
+NODE_LOOKUP_RETRIES = 3
+RETRY_BACKOFF_BASE = 2.0
+
+# Minimum spacing (seconds) between account registration starts
+REGISTER_START_INTERVAL = 3
 
-# Clash manager (singleton)
-clash_manager: Optional[ClashManager] = None
+# Background eviction of finished tasks
+_eviction_task: Optional[asyncio.Task] = None
+
+# Job queue consumed by long-lived workers, decoupled from request handling
+job_queue: asyncio.Queue = asyncio.Queue()
+_job_workers: List[asyncio.Task] = []
+
+
+async def run_job_worker(worker_id: int):
+    """Consume queued register/refresh jobs until cancelled."""
+    # Jobs need the proxy, wait until Clash has finished booting
+    await clash_started.wait()
+    
+    while True:
+        func, args = await job_queue.get()
+        try:
+            await func(*args)
+        except Exception as e:
+            logger.error("[API] Job worker %s error: %s", worker_id, e)
+        finally:
+            job_queue.task_done()
+
+
+# Successful results waiting to be written to accounts.json / result.csv.
+# A single writer drains it in batches so concurrent registrations share
+# one file rewrite instead of rewriting accounts.json per account.
+persist_queue: asyncio.Queue = asyncio.Queue()
+_persist_writer: Optional[asyncio.Task] = None
+
+
+def _write_results(batch: List[tuple]) -> None:
+    """Write a batch of (email, cookie_data, is_new_account) results to disk."""
+    update_accounts_json_many(
+        config.output_json_path,
+        [(email, data) for email, data, _ in batch]
+    )
+    new_accounts = [(email, data.get("password", "")) for email, data, is_new in batch if is_new]
+    if new_accounts:
+        append_many_to_csv(config.input_csv_path, new_accounts)
+
+
+async def run_persist_writer(batch_window: float = 1.0):
+    """Drain persist_queue, coalescing results that arrive within the window."""
+    while True:
+        batch = [await persist_queue.get()]
+        await asyncio.sleep(batch_window)
+        while not persist_queue.empty():
+            batch.append(persist_queue.get_nowait())
+        
+        try:
+            await asyncio.to_thread(_write_results, batch)
+        except Exception as e:
+            logger.error("[API] Failed to persist results: %s", e)
+        finally:
+            for _ in batch:
+                persist_queue.task_done()
 
 
 # ============ Startup ============
 
 @app.on_event("startup")
 async def startup():
-    global clash_manager
+    global shared_browser, _eviction_task, _persist_writer, _clash_boot_task
     
-    # Initialize Clash manager
-    clash_config_path = os.environ.get("CLASH_CONFIG", "local.yaml")
-    clash_executable = os.environ.get("CLASH_EXECUTABLE", "mihomo")
+    _eviction_task = asyncio.create_task(
+        run_eviction_loop(tasks, interval=60, ttl=config.task_ttl)
+    )
+    _persist_writer = asyncio.create_task(run_persist_writer())
+    for i in range(max(config.api_job_workers, 1)):
+        _job_workers.append(asyncio.create_task(run_job_worker(i)))
     
-    # Support CLASH_PROXIES environment variable
-    clash_proxies = os.environ.get("CLASH_PROXIES")
-    if clash_proxies:
-        # Write proxies to config file
-        with open(clash_config_path, "w") as f:
-            f.write(clash_proxies)
-        logger.info(f"[API] Written CLASH_PROXIES to {clash_config_path}")
+    if config.browser_shared:
+        from .browser_controller import get_shared_browser
+        # Launched lazily by the first account that needs it
+        shared_browser = get_shared_browser(headless=False)
     
-    clash_manager = ClashManager(executable=clash_executable, config=clash_config_path)
-    if not clash_manager.start():
-        logger.error("[API] Failed to start Clash manager")
-    else:
-        logger.info("[API] Clash manager started")
+    # Clash boots in the background so the server accepts requests at once;
+    # /api/health reports its state meanwhile.
+    _clash_boot_task = asyncio.create_task(start_clash())
+
+
+async def start_clash():
+    """Write the Clash config, start Clash and record the resulting state."""
+    global clash_manager, clash_state
+    
+    try:
+        # Initialize Clash manager
+        clash_config_path = os.environ.get("CLASH_CONFIG", "local.yaml")
+        clash_executable = os.environ.get("CLASH_EXECUTABLE", "mihomo")
+        
+        # Support CLASH_PROXIES environment variable
+        clash_proxies = os.environ.get("CLASH_PROXIES")
+        if clash_proxies:
+            # Write proxies to config file
+            await asyncio.to_thread(_write_text, clash_config_path, clash_proxies)
+            logger.info("[API] Written CLASH_PROXIES to %s", clash_config_path)
+        
+        from .clash_manager import ClashManager
+        
+        clash_manager = await asyncio.to_thread(
+            ClashManager,
+            executable=clash_executable,
+            config=clash_config_path,
+            latency_probe_concurrency=config.clash_probe_concurrency,
+            latency_probe_jitter_ms=config.clash_probe_jitter_ms
+        )
+        if await asyncio.to_thread(clash_manager.start):
+            clash_state = "ready"
+            logger.info("[API] Clash manager started")
+        else:
+            clash_state = "failed"
+            logger.error("[API] Failed to start Clash manager")
+    except Exception as e:
+        clash_state = "failed"
+        logger.error("[API] Failed to start Clash manager: %s", e)
+    finally:
+        clash_started.set()
+
+
+def _write_text(path: str, content: str) -> None:
+    """Write a text file (run in a thread from async code)."""
+    with open(path, "w") as f:
+        f.write(content)
 
 
 @app.on_event("shutdown")
 async def shutdown():
     global clash_manager
+    if _clash_boot_task:
+        _clash_boot_task.cancel()
+    if _eviction_task:
+        _eviction_task.cancel()
+    for worker in _job_workers:
+        worker.cancel()
+    if _persist_writer:
+        # Flush pending results before stopping the writer
+        await persist_queue.join()
+        _persist_writer.cancel()
+    if shared_browser:
+        from .browser_controller import shutdown_shared
+        await shutdown_shared()
     if clash_manager:
         clash_manager.stop()
         logger.info("[API] Clash manager stopped")
@@ -112,71 +443,115 @@ async def health():
     """Health check endpoint"""
     return {
         "status": "ok",
-        "clash_running": clash_manager is not None and clash_manager.process is not None
+        "clash_running": clash_manager is not None and clash_manager.process is not None,
+        "clash_state": clash_state
     }
 
 
+@app.get("/api/metrics")
+async def metrics():
+    """Per-stage job timings in Prometheus text format"""
+    return Response(
+        content=stage_metrics.render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.post("/api/register")
-async def register_accounts(req: RegisterRequest, background_tasks: BackgroundTasks):
+async def register_accounts(req: RegisterRequest):
     """
     Register new Gemini Business accounts.
     Returns a task_id for status tracking.
     """
-    task_id = str(uuid.uuid4())[:8]
+    task_id = secrets.token_hex(4)
     
     task = TaskInfo(
         task_id=task_id,
         status=TaskStatus.PENDING,
-        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        created_at=time.time(),
         progress={"total": req.count, "completed": 0, "success": 0, "failed": 0}
     )
-    tasks[task_id] = task
+    tasks.save(task)
     
-    # Run registration in background
-    background_tasks.add_task(run_register_task, task_id, req.count)
+    # Queue registration for a background worker
+    job_queue.put_nowait((run_register_task, (task_id, req.count)))
     
     return {"task_id": task_id, "status": "pending"}
 
 
 @app.post("/api/refresh")
-async def refresh_account(req: RefreshRequest, background_tasks: BackgroundTasks):
+async def refresh_account(req: RefreshRequest):
     """
     Refresh cookies for an existing account.
     Returns a task_id for status tracking.
     """
-    task_id = str(uuid.uuid4())[:8]
+    task_id = secrets.token_hex(4)
     
     task = TaskInfo(
         task_id=task_id,
         status=TaskStatus.PENDING,
-        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        created_at=time.time()
     )
-    tasks[task_id] = task
+    tasks.save(task)
     
-    # Run refresh in background
-    background_tasks.add_task(run_refresh_task, task_id, req.email, req.password)
+    # Queue refresh for a background worker
+    job_queue.put_nowait((run_refresh_task, (task_id, req.email, req.password)))
     
     return {"task_id": task_id, "status": "pending"}
 
 
 @app.get("/api/status/{task_id}")
-async def get_task_status(task_id: str):
-    """Get the status of a task"""
-    if task_id not in tasks:
+async def get_task_status(task_id: str, wait: float = 0):
+    """
+    Get the status of a task.
+    With `wait` (seconds, max 60), long-poll until the task changes.
+    """
+    task = tasks.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return tasks[task_id]
+    if wait > 0 and task.status not in TaskStore.TERMINAL_STATUSES:
+        await tasks.wait_for_change(task_id, min(wait, 60))
+        task = tasks.get(task_id)
+        if task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+    
+    return task
+
+
+@app.websocket("/api/status/ws/{task_id}")
+async def stream_task_status(websocket: WebSocket, task_id: str):
+    """Push task updates until the task finishes"""
+    await websocket.accept()
+    
+    try:
+        while True:
+            # Subscribe before reading, a notify() while sending sets this event
+            changed = tasks.change_event(task_id)
+            task = tasks.get(task_id)
+            if task is None:
+                await websocket.send_json({"error": "Task not found"})
+                break
+            
+            await websocket.send_json(task.model_dump(mode="json"))
+            if task.status in TaskStore.TERMINAL_STATUSES:
+                break
+            
+            await tasks.wait_for_change(task_id, 30, changed)
+        
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 
 @app.get("/api/tasks")
 async def list_tasks(limit: int = 20):
     """List recent tasks"""
-    sorted_tasks = sorted(
-        tasks.values(),
-        key=lambda t: t.created_at,
-        reverse=True
+    # Serialize the whole page to JSON in one pydantic-core call
+    return Response(
+        content=_task_list_adapter.dump_json(tasks.list(limit)),
+        media_type="application/json"
     )
-    return sorted_tasks[:limit]
 
 
 # ============ Background Tasks ============
@@ -185,40 +560,76 @@ async def run_register_task(task_id: str, count: int):
     """Background task to register accounts"""
     global clash_manager
     
-    task = tasks[task_id]
+    task = tasks.get(task_id)
     task.status = TaskStatus.RUNNING
+    tasks.notify(task_id)
     
     results = []
     success_count = 0
     fail_count = 0
+    completed = 0
+    parallel = max(config.max_parallel_registers, 1)
+    sem = asyncio.Semaphore(parallel)
     
-    try:
-        for i in range(count):
+    # Clash routes everything through the group's one selected node. Parallel
+    # registrations each calling find_healthy_node would re-route the ones
+    # already running, so pick the node once for the whole batch.
+    batch_node = None
+    if parallel > 1 and count > 1 and not _clash_unavailable(clash_manager):
+        batch_node = await _find_node(clash_manager)
+        if not batch_node:
+            task.status = TaskStatus.FAILED
+            task.error = "No healthy proxy node"
+            task.completed_at = time.time()
+            tasks.notify(task_id)
+            return
+    
+    # Account starts are spaced REGISTER_START_INTERVAL apart; a slot only
+    # sleeps when it would start earlier than its scheduled time.
+    loop = asyncio.get_running_loop()
+    next_start = loop.time()
+    
+    async def _register_one(i: int):
+        nonlocal success_count, fail_count, completed, next_start
+        
+        async with sem:
+            now = loop.time()
+            start_at = max(now, next_start)
+            next_start = start_at + REGISTER_START_INTERVAL
+            if start_at > now:
+                await asyncio.sleep(start_at - now)
+            
             task.progress = {
                 "total": count,
-                "completed": i,
+                "completed": completed,
                 "success": success_count,
                 "failed": fail_count,
                 "current": f"Registering account {i+1}/{count}"
             }
+            tasks.notify(task_id)
             
-            result = await register_single_account(clash_manager)
+            result = await register_single_account(clash_manager, batch_node)
             
             if result:
                 results.append(result)
                 success_count += 1
                 
-                # Save to accounts.json
-                update_accounts_json(config.output_json_path, result["email"], result)
-                
-                # Save to result.csv
-                append_to_csv(config.input_csv_path, result["email"], result.get("password", ""))
+                # Queue for accounts.json and result.csv
+                persist_queue.put_nowait((result["email"], result, True))
             else:
                 fail_count += 1
+            completed += 1
             
-            # Cooldown between accounts
-            if i < count - 1:
-                await asyncio.sleep(3)
+            task.progress = {
+                "total": count,
+                "completed": completed,
+                "success": success_count,
+                "failed": fail_count
+            }
+            tasks.notify(task_id)
+    
+    try:
+        await asyncio.gather(*(_register_one(i) for i in range(count)))
         
         task.status = TaskStatus.SUCCESS
         task.result = {
@@ -236,17 +647,19 @@ async def run_register_task(task_id: str, count: int):
     except Exception as e:
         task.status = TaskStatus.FAILED
         task.error = str(e)
-        logger.error(f"[API] Register task failed: {e}")
+        logger.error("[API] Register task failed: %s", e)
     
-    task.completed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    task.completed_at = time.time()
+    tasks.notify(task_id)
 
 
 async def run_refresh_task(task_id: str, email: str, password: str):
     """Background task to refresh account cookies"""
     global clash_manager
     
-    task = tasks[task_id]
+    task = tasks.get(task_id)
     task.status = TaskStatus.RUNNING
+    tasks.notify(task_id)
     
     try:
         result = await refresh_single_account(clash_manager, email, password)
@@ -255,8 +668,8 @@ async def run_refresh_task(task_id: str, email: str, password: str):
             task.status = TaskStatus.SUCCESS
             task.result = result
             
-            # Update accounts.json
-            update_accounts_json(config.output_json_path, email, result)
+            # Queue for accounts.json
+            persist_queue.put_nowait((email, result, False))
         else:
             task.status = TaskStatus.FAILED
             task.error = "Failed to refresh cookies"
@@ -264,137 +677,214 @@ async def run_refresh_task(task_id: str, email: str, password: str):
     except Exception as e:
         task.status = TaskStatus.FAILED
         task.error = str(e)
-        logger.error(f"[API] Refresh task failed: {e}")
+        logger.error("[API] Refresh task failed: %s", e)
     
-    task.completed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    task.completed_at = time.time()
+    tasks.notify(task_id)
 
 
 # ============ Core Functions ============
 
-async def register_single_account(clash_manager: ClashManager) -> Optional[dict]:
-    """Register a single new account"""
+async def _discard_result(future: asyncio.Future) -> None:
+    """Wait for an abandoned future and drop its result or exception."""
+    try:
+        await future
+    except Exception:
+        pass
+
+
+def _clash_unavailable(clash_manager: Optional["ClashManager"]) -> bool:
+    """Log and report whether Clash failed to start (or never started)."""
+    if clash_manager is None or clash_state == "failed":
+        logger.error("[API] Clash proxy is not available (state: %s)", clash_state)
+        return True
+    return False
+
+
+async def _find_node(clash_manager: "ClashManager") -> Optional[str]:
+    """Find and select a healthy proxy node, retrying briefly if none is available yet."""
+    node = None
+    for lookup in range(NODE_LOOKUP_RETRIES):
+        if lookup > 0:
+            await asyncio.sleep(2)
+        node = await run_in_threadpool(clash_manager.find_healthy_node)
+        if node:
+            break
     
-    # Find healthy proxy node
-    node = clash_manager.find_healthy_node()
     if not node:
         logger.error("[API] No healthy proxy node")
+    return node
+
+
+async def register_single_account(
+    clash_manager: Optional["ClashManager"],
+    node: Optional[str] = None
+) -> Optional[dict]:
+    """
+    Register a single new account.
+    
+    Args:
+        clash_manager: Running ClashManager
+        node: Node already selected for this batch; looked up if not given
+    """
+    from .mail_client import MailClient
+    from .browser_controller import BrowserController
+    
+    if _clash_unavailable(clash_manager):
         return None
     
-    logger.info(f"[API] Using proxy node: {node}")
+    # A node chosen for the whole batch is shared, don't re-select per account
+    own_node = node is None
+    if own_node:
+        node = await _find_node(clash_manager)
+        if not node:
+            return None
+    
+    logger.info("[API] Using proxy node: %s", node)
+    proxy_url = clash_manager.get_proxy_url()
     
     max_retries = 3
     
-    for attempt in range(max_retries):
-        if attempt > 0:
-            logger.info(f"[API] Retry {attempt + 1}/{max_retries}")
-        
-        # Create new mail client
-        mail_client = MailClient(proxy_url=clash_manager.get_proxy_url())
-        
-        if not mail_client.register():
-            logger.error("[API] Failed to register email")
-            continue
-        
-        email = mail_client.email
-        password = mail_client.password
-        logger.info(f"[API] Using email: {email}")
-        
-        # Create browser
-        browser = BrowserController(
-            proxy_url=clash_manager.get_proxy_url(),
-            headless=False  # Must be non-headless
-        )
+    # One browser serves every attempt; its session is wiped in between
+    browser = BrowserController(
+        proxy_url=proxy_url,
+        headless=False,  # Must be non-headless
+        shared_browser=shared_browser
+    )
+    
+    try:
+        await stage_metrics.timed("browser_start", browser.start())
         
-        try:
-            await browser.start()
-            
-            if not await browser.login(email, password):
-                logger.error("[API] Failed to login")
-                await browser.stop()
-                continue
-            
-            code = mail_client.wait_for_code(timeout=30)
-            
-            if not code:
-                logger.warning("[API] Verification code timeout")
-                await browser.stop()
-                continue
+        for attempt in range(max_retries):
+            if attempt > 0:
+                # Exponential backoff with jitter before retrying
+                delay = RETRY_BACKOFF_BASE * (2 ** (attempt - 1)) + random.random()
+                logger.info("[API] Retry %s/%s in %.1fs", attempt + 1, max_retries, delay)
+                await asyncio.sleep(delay)
+                await browser.reset_or_restart()
             
-            logger.info(f"[API] Got code: {code}")
+            # Create new mail client
+            mail_client = MailClient(proxy_url=proxy_url)
             
-            if not await browser.enter_verification_code(code):
-                await browser.stop()
+            if not await run_in_threadpool(mail_client.register):
+                logger.error("[API] Failed to register email")
                 continue
             
-            if not await browser.wait_for_login_complete(timeout=60):
-                await browser.stop()
-                continue
+            email = mail_client.email
+            password = mail_client.password
+            logger.info("[API] Using email: %s", email)
             
-            cookie_data = await browser.extract_cookies()
+            code_task = None
             
-            if not cookie_data.get("secure_c_ses"):
-                await browser.stop()
+            try:
+                # The mailbox is brand new, so start polling for the code while
+                # the browser is still submitting the email (overlaps both waits)
+                code_task = asyncio.ensure_future(run_in_threadpool(mail_client.wait_for_code, 45))
+                
+                if not await stage_metrics.timed("login", browser.login(email, password)):
+                    logger.error("[API] Failed to login")
+                    mail_client.cancel_wait()
+                    await _discard_result(code_task)
+                    continue
+                
+                code = await stage_metrics.timed("wait_for_code", code_task)
+                
+                if not code:
+                    logger.warning("[API] Verification code timeout")
+                    continue
+                
+                logger.info("[API] Got code: %s", code)
+                
+                if not await stage_metrics.timed("enter_code", browser.enter_verification_code(code)):
+                    continue
+                
+                if not await stage_metrics.timed("login_complete", browser.wait_for_login_complete(timeout=60)):
+                    continue
+                
+                cookie_data = await stage_metrics.timed("extract_cookies", browser.extract_cookies())
+                
+                if not cookie_data.get("secure_c_ses"):
+                    continue
+                
+                cookie_data["email"] = email
+                cookie_data["password"] = password
+                
+                logger.info("[API] ✅ Registered: %s", email)
+                return cookie_data
+                
+            except Exception as e:
+                logger.error("[API] Error: %s", e)
+                if code_task:
+                    mail_client.cancel_wait()
+                    await _discard_result(code_task)
                 continue
-            
-            cookie_data["email"] = email
-            cookie_data["password"] = password
-            
-            logger.info(f"[API] ✅ Registered: {email}")
-            await browser.stop()
-            return cookie_data
-            
-        except Exception as e:
-            logger.error(f"[API] Error: {e}")
-            await browser.stop()
-            continue
     
+    except Exception as e:
+        logger.error("[API] Error: %s", e)
+    
+    finally:
+        await browser.stop()
+    
+    if own_node:
+        # Let the next lookup skip this node for a while
+        clash_manager.mark_node_failed(node)
     return None
 
 
-async def refresh_single_account(clash_manager: ClashManager, email: str, password: str) -> Optional[dict]:
+async def refresh_single_account(clash_manager: Optional["ClashManager"], email: str, password: str) -> Optional[dict]:
     """Refresh cookies for a single account"""
+    from .mail_client import MailClient
+    from .browser_controller import BrowserController
     
-    node = clash_manager.find_healthy_node()
+    if _clash_unavailable(clash_manager):
+        return None
+    
+    # The parallel latency sweep blocks, keep it off the event loop
+    node = await run_in_threadpool(clash_manager.find_healthy_node)
     if not node:
         logger.error("[API] No healthy proxy node")
         return None
     
-    logger.info(f"[API] Refreshing {email} with node: {node}")
+    logger.info("[API] Refreshing %s with node: %s", email, node)
+    proxy_url = clash_manager.get_proxy_url()
     
-    mail_client = MailClient(proxy_url=clash_manager.get_proxy_url())
+    mail_client = MailClient(proxy_url=proxy_url)
     
     # Login to existing email
-    if not mail_client.login_existing(email, password):
-        logger.error(f"[API] Failed to login to email: {email}")
+    if not await run_in_threadpool(mail_client.login_existing, email, password):
+        logger.error("[API] Failed to login to email: %s", email)
         return None
     
     browser = BrowserController(
-        proxy_url=clash_manager.get_proxy_url(),
-        headless=False
+        proxy_url=proxy_url,
+        headless=False,
+        shared_browser=shared_browser
     )
     
     try:
-        await browser.start()
+        await stage_metrics.timed("browser_start", browser.start())
         
-        if not await browser.login(email, password):
+        if not await stage_metrics.timed("login", browser.login(email, password)):
             logger.error("[API] Failed to login")
             return None
         
-        code = mail_client.wait_for_code(timeout=30)
+        code = await stage_metrics.timed(
+            "wait_for_code", run_in_threadpool(mail_client.wait_for_code, 30)
+        )
         
         if not code:
             logger.error("[API] Verification code timeout")
             return None
         
-        logger.info(f"[API] Got code: {code}")
+        logger.info("[API] Got code: %s", code)
         
-        if not await browser.enter_verification_code(code):
+        if not await stage_metrics.timed("enter_code", browser.enter_verification_code(code)):
             return None
         
-        if not await browser.wait_for_login_complete(timeout=60):
+        if not await stage_metrics.timed("login_complete", browser.wait_for_login_complete(timeout=60)):
             return None
         
-        cookie_data = await browser.extract_cookies()
+        cookie_data = await stage_metrics.timed("extract_cookies", browser.extract_cookies())
         
         if not cookie_data.get("secure_c_ses"):
             return None
@@ -402,11 +892,11 @@ async def refresh_single_account(clash_manager: ClashManager, email: str, passwo
         cookie_data["email"] = email
         cookie_data["password"] = password
         
-        logger.info(f"[API] ✅ Refreshed: {email}")
+        logger.info("[API] ✅ Refreshed: %s", email)
         return cookie_data
         
     except Exception as e:
-        logger.error(f"[API] Error: {e}")
+        logger.error("[API] Error: %s", e)
         return None
         
     finally:
@@ -416,9 +906,23 @@ async def refresh_single_account(clash_manager: ClashManager, email: str, passwo
 # ============ Run Server ============
 
 def run_server(host: str = "0.0.0.0", port: int = 8000):
-    """Run the API server"""
+    """
+    Run the API server.
+    
+    Uses uvloop and httptools when installed (uvicorn[standard]). Runs a
+    single worker on purpose: the task store is in-memory and each worker
+    would start its own Clash process on the same ports.
+    """
     import uvicorn
-    uvicorn.run(app, host=host, port=port)
+    uvicorn.run(
+        app,
+        host=host,
+        port=port,
+        loop="auto",
+        http="auto",
+        limit_concurrency=1000,
+        timeout_keep_alive=30
+    )
 
 
 if __name__ == "__main__":
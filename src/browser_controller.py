@@ -7,6 +7,9 @@ Optimized based on V1.1.Gemini.Business/auto_register_browser.py
 
 import asyncio
 import os
+import re
+import shutil
+import tempfile
 import urllib.parse
 from pathlib import Path
 from typing import Optional
@@ -15,7 +18,357 @@ from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 from playwright_stealth import Stealth
 
 from .utils import logger
-from .config import config
+from .config import get_config
+
+
+# Chromium launch args with strong anti-detection. Chromium keeps only the
+# last --disable-features switch, so all disabled features go in one.
+LAUNCH_ARGS = [
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-blink-features=AutomationControlled",
+    "--window-size=1920,1080",
+    # Anti-headless detection and fingerprint masking
+    "--disable-features=IsolateOrigins,site-per-process,UserAgentClientHint",
+    "--disable-site-isolation-trials",
+    "--disable-reading-from-canvas",
+]
+
+# Opt-in flags, see BROWSER_DISABLE_GPU / BROWSER_DISABLE_WEB_SECURITY
+DISABLE_GPU_ARGS = ["--disable-gpu"]
+DISABLE_WEB_SECURITY_ARGS = [
+    "--disable-web-security",
+    "--allow-running-insecure-content",
+]
+
+# playwright-stealth patches, the configuration never changes
+_STEALTH = Stealth(
+    navigator_webdriver=True,  # Hide webdriver flag
+    navigator_plugins=True,    # Fake plugins
+    navigator_languages=True,  # Fake languages
+    webgl_vendor=True,         # Mask WebGL fingerprint
+    chrome_runtime=True,       # Add chrome.runtime
+)
+
+# Resource types blocked when BROWSER_BLOCK_ASSETS is on. Stylesheets are
+# kept because the input stability check relies on computed styles.
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
+
+# URL fragments that mean the code was accepted / the account is signed in
+_VERIFY_OK_RE = re.compile("home|admin|setup|create|dashboard")
+_LOGIN_OK_RE = re.compile("home|admin|setup|create|dashboard|cid")
+# URL fragments that mean we are still on the verification page
+_LOGIN_FAIL_RE = re.compile("verify|oob|error")
+
+# config_id path segment and csesidx query value of the signed-in URL
+_CONFIG_ID_RE = re.compile(r"/cid/([^/?#]+)")
+_CSESIDX_RE = re.compile(r"[?&]csesidx=([^&#]+)")
+
+
+# Resolves with the first selector whose element is present and ready for
+# input (enabled, writable, rendered with a size, not visibility:hidden), or
+# null after timeoutMs. Only the first match is checked, since callers act
+# on document.querySelector(selector). A MutationObserver re-checks on DOM
+# changes instead of polling from Python.
+_WAIT_FOR_SELECTORS_JS = '''
+    ([selectors, timeoutMs]) => new Promise((resolve) => {
+        const check = () => {
+            for (const selector of selectors) {
+                let el = null;
+                try { el = document.querySelector(selector); } catch (e) { continue; }
+                if (el && !el.disabled && !el.readOnly &&
+                    el.getClientRects().length > 0 &&
+                    window.getComputedStyle(el).visibility !== "hidden") {
+                    return selector;
+                }
+            }
+            return null;
+        };
+        const found = check();
+        if (found) {
+            resolve(found);
+            return;
+        }
+        const observer = new MutationObserver(() => {
+            const selector = check();
+            if (selector) {
+                observer.disconnect();
+                clearTimeout(timer);
+                resolve(selector);
+            }
+        });
+        const timer = setTimeout(() => {
+            observer.disconnect();
+            resolve(null);
+        }, timeoutMs);
+        observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true});
+    })
+'''
+
+
+# Sets the value of the first matching input and fires input/change events
+_INPUT_JS = '''
+    ([selectors, value]) => {
+        for (const selector of selectors) {
+            try {
+                let el = document.querySelector(selector);
+                if (el) {
+                    el.focus();
+                    el.value = value;
+                    el.dispatchEvent(new Event("input", {bubbles: true}));
+                    el.dispatchEvent(new Event("change", {bubbles: true}));
+                    return el.value === value;
+                }
+            } catch (e) {}
+        }
+        return false;
+    }
+'''
+
+# Clicks the first element matching one of the selectors
+_CLICK_JS = '''
+    (selectors) => {
+        for (const selector of selectors) {
+            try {
+                let el = document.querySelector(selector);
+                if (el) {
+                    el.click();
+                    return true;
+                }
+            } catch (e) {}
+        }
+        return false;
+    }
+'''
+
+# Reads the value of the first input matching one of the selectors
+_READ_VALUE_JS = '''
+    (selectors) => {
+        for (const selector of selectors) {
+            try {
+                let el = document.querySelector(selector);
+                if (el) return el.value;
+            } catch (e) {}
+        }
+        return "";
+    }
+'''
+
+# Sets an input's value through the native setter (so framework-controlled
+# inputs see it) and fires input/change, in one round-trip
+_SET_VALUE_JS = '''
+    (el, value) => {
+        el.focus();
+        const setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, "value").set;
+        setter.call(el, value);
+        el.dispatchEvent(new Event("input", {bubbles: true}));
+        el.dispatchEvent(new Event("change", {bubbles: true}));
+        return el.value === value;
+    }
+'''
+
+# Clicks the verify button, skipping "resend" buttons
+_CLICK_VERIFY_JS = '''
+    () => {
+        let buttons = document.querySelectorAll("button");
+        for (let btn of buttons) {
+            let text = btn.textContent || "";
+            // Skip resend buttons
+            if (text.includes("重新") || text.includes("发送") ||
+                text.toLowerCase().includes("resend")) {
+                continue;
+            }
+            if (text.trim()) {
+                btn.click();
+                return true;
+            }
+        }
+        return false;
+    }
+'''
+
+# True once the button matching the CSS selector exists and is enabled
+_BUTTON_READY_JS = '''
+    (selector) => {
+        const btn = document.querySelector(selector);
+        return !!btn && !btn.disabled;
+    }
+'''
+
+# True once a non-"resend" button with text is enabled
+_VERIFY_READY_JS = '''
+    () => {
+        for (let btn of document.querySelectorAll("button")) {
+            let text = btn.textContent || "";
+            if (text.includes("重新") || text.includes("发送") ||
+                text.toLowerCase().includes("resend")) {
+                continue;
+            }
+            if (text.trim()) return !btn.disabled;
+        }
+        return false;
+    }
+'''
+
+# Fills the code input via the native setter, fires input/change and clicks
+# the verify button in one go. Returns "clicked", "typed" (button not
+# enabled yet) or "missing" (no code input).
+_SUBMIT_CODE_JS = '''
+    ([selector, code]) => {
+        const el = document.querySelector(selector);
+        if (!el) return "missing";
+        el.focus();
+        const setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, "value").set;
+        setter.call(el, code);
+        el.dispatchEvent(new Event("input", {bubbles: true}));
+        el.dispatchEvent(new Event("change", {bubbles: true}));
+        if (window.__gem_verifyReady() && window.__gem_clickVerify()) return "clicked";
+        return "typed";
+    }
+'''
+
+# Installs the helpers above as window.__gem_* on every new document, so
+# each call ships a one-line expression instead of re-sending the source
+_PAGE_HELPERS_JS = f"""
+window.__gem_waitFor = {_WAIT_FOR_SELECTORS_JS};
+window.__gem_input = {_INPUT_JS};
+window.__gem_click = {_CLICK_JS};
+window.__gem_readValue = {_READ_VALUE_JS};
+window.__gem_clickVerify = {_CLICK_VERIFY_JS};
+window.__gem_buttonReady = {_BUTTON_READY_JS};
+window.__gem_verifyReady = {_VERIFY_READY_JS};
+window.__gem_submitCode = {_SUBMIT_CODE_JS};
+"""
+
+
+def _remove_profile_dir(user_data_dir: str) -> None:
+    """Delete a browser profile directory if it exists."""
+    if os.path.exists(user_data_dir):
+        try:
+            shutil.rmtree(user_data_dir)
+            logger.info("[Browser] Cleaned up old browser profile")
+        except Exception as e:
+            logger.warning("[Browser] Failed to clean profile: %s", e)
+
+
+def _launch_args() -> list:
+    """Build the Chromium args from the defaults plus enabled opt-in flags."""
+    args = list(LAUNCH_ARGS)
+    if get_config().browser_disable_gpu:
+        args += DISABLE_GPU_ARGS
+    if get_config().browser_disable_web_security:
+        args += DISABLE_WEB_SECURITY_ARGS
+    return args
+
+
+async def _launch_browser(playwright, headless: bool, args: Optional[list] = None) -> Browser:
+    """Launch a standalone Chromium (no extension, no persistent profile)."""
+    return await playwright.chromium.launch(
+        headless=headless,
+        args=_launch_args() if args is None else args,
+        ignore_default_args=["--enable-automation"]
+    )
+
+
+async def _new_browser_context(browser: Browser, proxy_config: Optional[dict]) -> BrowserContext:
+    """Create an isolated browser context with its own cookies and proxy."""
+    return await browser.new_context(
+        proxy=proxy_config,
+        viewport={"width": 1920, "height": 1080},
+        user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        locale="en-US",
+        timezone_id="America/New_York"
+    )
+
+
+async def _abort_heavy_asset(route) -> None:
+    """Route handler that drops images, fonts and media."""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _block_heavy_assets(context: BrowserContext) -> None:
+    """Stop the context from downloading assets the login flow never needs."""
+    if get_config().browser_block_assets:
+        await context.route("**/*", _abort_heavy_asset)
+
+
+async def _prepare_context(context: BrowserContext) -> None:
+    """Install page helpers and request blocking on a new context."""
+    await context.add_init_script(_PAGE_HELPERS_JS)
+    await _block_heavy_assets(context)
+
+
+class SharedBrowser:
+    """
+    Long-lived Playwright + Chromium instance shared by many controllers.
+    
+    Controllers created with it open a fresh BrowserContext per account
+    instead of launching Chromium every time. Extensions are not loaded,
+    since they require a persistent context.
+    """
+    
+    def __init__(self, headless: bool = True):
+        self.headless = headless
+        self._playwright = None
+        self._browser: Optional[Browser] = None
+        self._lock = asyncio.Lock()
+    
+    @property
+    def browser(self) -> Optional[Browser]:
+        return self._browser
+    
+    async def start(self) -> None:
+        """Launch the browser if it is not running yet."""
+        async with self._lock:
+            if self._browser and self._browser.is_connected():
+                return
+            if not self._playwright:
+                self._playwright = await async_playwright().start()
+            self._browser = await _launch_browser(self._playwright, self.headless)
+            logger.info("[Browser] Shared browser started")
+    
+    async def stop(self) -> None:
+        """Close the browser and Playwright driver."""
+        async with self._lock:
+            if self._browser:
+                await self._browser.close()
+                self._browser = None
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+            logger.info("[Browser] Shared browser stopped")
+
+
+# Process-wide browser handed out by get_shared_browser()
+_SHARED_BROWSER: Optional[SharedBrowser] = None
+
+
+def get_shared_browser(headless: bool = True) -> SharedBrowser:
+    """
+    Get the process-wide shared browser, creating it on first use.
+    
+    The browser itself is launched lazily by the first controller that
+    starts on it.
+    
+    Args:
+        headless: Headless mode, only used when the instance is created
+    """
+    global _SHARED_BROWSER
+    if _SHARED_BROWSER is None:
+        _SHARED_BROWSER = SharedBrowser(headless=headless)
+    return _SHARED_BROWSER
+
+
+async def shutdown_shared() -> None:
+    """Close the process-wide shared browser if one was created."""
+    global _SHARED_BROWSER
+    if _SHARED_BROWSER is not None:
+        await _SHARED_BROWSER.stop()
+        _SHARED_BROWSER = None
 
 
 class BrowserController:
@@ -51,11 +404,20 @@ class BrowserController:
         'button:has-text("Continue")'
     ]
     
+    # Plain-CSS continue buttons (no Playwright pseudo-classes) for in-page checks
+    CONTINUE_BUTTON_CSS = '#log-in-button, button[type="submit"]'
+    
+    # Joined selector lists for a single wait_for_selector call
+    EMAIL_SELECTOR_CSS = ", ".join(EMAIL_SELECTORS)
+    CODE_SELECTOR_CSS = ", ".join(CODE_SELECTORS)
+    CONTINUE_SELECTOR_CSS = ", ".join(CONTINUE_SELECTORS)
+    
     def __init__(
         self,
         proxy_url: Optional[str] = None,
         headless: bool = True,
-        extension_path: Optional[str] = None
+        extension_path: Optional[str] = None,
+        shared_browser: Optional[SharedBrowser] = None
     ):
         """
         Initialize browser controller.
@@ -64,15 +426,19 @@ class BrowserController:
             proxy_url: HTTP proxy URL (e.g., http://127.0.0.1:17890)
             headless: Run browser in headless mode
             extension_path: Path to Chrome extension directory
+            shared_browser: Reuse this browser and only open a new context
         """
         self.proxy_url = proxy_url
         self.headless = headless
+        self.shared_browser = shared_browser
         self.extension_path = extension_path or self._get_default_extension_path()
         
         self._playwright = None
         self._browser: Optional[Browser] = None
         self._context: Optional[BrowserContext] = None
         self._page: Optional[Page] = None
+        self._user_data_dir: Optional[str] = None
+        self._cleanup_task: Optional[asyncio.Task] = None
     
     def _get_default_extension_path(self) -> str:
         """Get default extension path relative to project root."""
@@ -82,52 +448,41 @@ class BrowserController:
     
     async def start(self) -> None:
         """Start browser with Playwright."""
+        # Configure proxy
+        proxy_config = None
+        if self.proxy_url:
+            proxy_config = {"server": self.proxy_url}
+            logger.info("[Browser] Using proxy: %s", self.proxy_url)
+        
+        if self.shared_browser is not None:
+            # Reuse the long-lived browser, only open a fresh context
+            await self.shared_browser.start()
+            self._context = await _new_browser_context(self.shared_browser.browser, proxy_config)
+            await _prepare_context(self._context)
+            self._page = await self._context.new_page()
+            await self._apply_stealth()
+            logger.info("[Browser] New context on shared browser (with stealth)")
+            return
+        
+        use_extension = os.path.exists(self.extension_path) and not self.headless
         self._playwright = await async_playwright().start()
         
-        # Build launch args with strong anti-detection
-        launch_args = [
-            "--no-sandbox",
-            "--disable-setuid-sandbox",
-            "--disable-dev-shm-usage",
-            "--disable-blink-features=AutomationControlled",
-            "--disable-gpu",
-            "--window-size=1920,1080",
-            # Anti-headless detection
-            "--disable-features=IsolateOrigins,site-per-process",
-            "--disable-site-isolation-trials",
-            "--disable-web-security",
-            "--allow-running-insecure-content",
-            # Fingerprint masking
-            "--disable-features=UserAgentClientHint",
-            "--disable-reading-from-canvas",
-        ]
+        launch_args = _launch_args()
         
         # Add extension if available and not headless
-        if os.path.exists(self.extension_path) and not self.headless:
+        if use_extension:
             launch_args.extend([
                 f"--disable-extensions-except={self.extension_path}",
                 f"--load-extension={self.extension_path}",
             ])
-            logger.info(f"[Browser] Loading extension from: {self.extension_path}")
-        
-        # Configure proxy
-        proxy_config = None
-        if self.proxy_url:
-            proxy_config = {"server": self.proxy_url}
-            logger.info(f"[Browser] Using proxy: {self.proxy_url}")
+            logger.info("[Browser] Loading extension from: %s", self.extension_path)
         
         # Launch browser
-        if os.path.exists(self.extension_path) and not self.headless:
+        if use_extension:
             # Use launch_persistent_context for extension support
-            # Clean up old profile to ensure fresh session for each account
-            user_data_dir = "/tmp/gemini-browser-profile"
-            import shutil
-            if os.path.exists(user_data_dir):
-                try:
-                    shutil.rmtree(user_data_dir)
-                    logger.info("[Browser] Cleaned up old browser profile")
-                except Exception as e:
-                    logger.warning(f"[Browser] Failed to clean profile: {e}")
+            # A fresh profile dir per run gives each account a clean session
+            # and keeps concurrent controllers apart; it is removed in stop()
+            self._user_data_dir = tempfile.mkdtemp(prefix="gemini-browser-")
             
             # Check if custom chromium path is specified (for Docker containers)
             chromium_path = os.environ.get("CHROMIUM_PATH")
@@ -141,80 +496,224 @@ class BrowserController:
             
             if chromium_path and os.path.exists(chromium_path):
                 launch_kwargs["executable_path"] = chromium_path
-                logger.info(f"[Browser] Using system chromium: {chromium_path}")
+                logger.info("[Browser] Using system chromium: %s", chromium_path)
             
             self._context = await self._playwright.chromium.launch_persistent_context(
-                user_data_dir,
+                self._user_data_dir,
                 **launch_kwargs
             )
+            await _prepare_context(self._context)
             self._page = self._context.pages[0] if self._context.pages else await self._context.new_page()
         else:
             # Standard launch without extension
-            # Add more anti-detection flags
-            headless_args = [
-                "--disable-blink-features=AutomationControlled",
-                "--disable-features=IsolateOrigins,site-per-process",
-                "--disable-site-isolation-trials",
-            ] if self.headless else []
-            
-            self._browser = await self._playwright.chromium.launch(
-                headless=self.headless,
-                args=launch_args + headless_args,
-                ignore_default_args=["--enable-automation"]
-            )
-            self._context = await self._browser.new_context(
-                proxy=proxy_config,
-                viewport={"width": 1920, "height": 1080},
-                user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                locale="en-US",
-                timezone_id="America/New_York"
-            )
+            self._browser = await _launch_browser(self._playwright, self.headless, launch_args)
+            self._context = await _new_browser_context(self._browser, proxy_config)
+            await _prepare_context(self._context)
             self._page = await self._context.new_page()
-        
-        # Apply playwright-stealth to bypass bot detection
-        stealth = Stealth(
-            navigator_webdriver=True,  # Hide webdriver flag
-            navigator_plugins=True,    # Fake plugins
-            navigator_languages=True,  # Fake languages
-            webgl_vendor=True,         # Mask WebGL fingerprint
-            chrome_runtime=True,       # Add chrome.runtime
-        )
-        await stealth.apply_stealth_async(self._page)
-        
+
+        await self._apply_stealth()
         logger.info("[Browser] Started successfully (with stealth)")
     
+    async def _apply_stealth(self) -> None:
+        """Apply playwright-stealth to bypass bot detection."""
+        await _STEALTH.apply_stealth_async(self._page)
+    
+    async def __aenter__(self) -> "BrowserController":
+        try:
+            await self.start()
+        except BaseException:
+            # __aexit__ is not called when entering fails
+            await self.stop()
+            raise
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+    
     async def stop(self) -> None:
-        """Stop browser and cleanup."""
-        if self._context:
-            await self._context.close()
-        if self._browser:
-            await self._browser.close()
-        if self._playwright:
-            await self._playwright.stop()
+        """Stop browser and cleanup. Safe to call more than once."""
+        context, self._context = self._context, None
+        browser, self._browser = self._browser, None
+        playwright, self._playwright = self._playwright, None
+        self._page = None
+        
+        if context:
+            await context.close()
+        if browser:
+            await browser.close()
+        if playwright:
+            await playwright.stop()
+        
+        if self._user_data_dir:
+            # Delete the profile in the background, callers need not wait
+            self._cleanup_task = asyncio.create_task(
+                asyncio.to_thread(_remove_profile_dir, self._user_data_dir)
+            )
+            self._user_data_dir = None
         
         logger.info("[Browser] Stopped")
     
-    async def _find_element_by_selectors(self, selectors: list, timeout: int = 5000) -> Optional[any]:
+    async def reset_session(self) -> None:
+        """
+        Clear cookies, cache and Gemini storage so the next account starts fresh.
+        
+        Lets callers reuse one started controller (including the persistent
+        extension profile) across accounts instead of relaunching Chromium.
+        """
+        # Leave the site first so the old page cannot write state back
+        await self._page.goto("about:blank")
+        
+        client = await self._context.new_cdp_session(self._page)
+        try:
+            await client.send("Network.clearBrowserCookies")
+            await client.send("Network.clearBrowserCache")
+            await client.send("Storage.clearDataForOrigin", {
+                "origin": self.GEMINI_LOGIN_URL.rstrip("/"),
+                "storageTypes": "all"
+            })
+        finally:
+            await client.detach()
+        
+        logger.info("[Browser] Session reset")
+    
+    async def reset_or_restart(self) -> None:
+        """Reset the session for the next account, relaunching if that fails."""
+        try:
+            await self.reset_session()
+        except Exception as e:
+            # A failed attempt can leave the page or browser unusable
+            logger.warning("[Browser] Session reset failed, restarting: %s", e)
+            await self.stop()
+            await self.start()
+    
+    async def _find_element_by_selectors(
+        self,
+        selectors: list,
+        timeout: int = 5000,
+        combined: Optional[str] = None
+    ) -> Optional[any]:
         """
         Find element using multiple selector fallbacks.
         
+        Waits once for any of the selectors, then picks the match by
+        selector priority (a joined query alone would return the first
+        match in document order).
+        
         Args:
-            selectors: List of CSS selectors to try
-            timeout: Timeout per selector in ms
+            selectors: List of CSS selectors to try, most specific first
+            timeout: Total timeout in ms
+            combined: Precomputed ", ".join(selectors)
             
         Returns:
             Element handle or None if not found
         """
+        try:
+            await self._page.wait_for_selector(combined or ", ".join(selectors), timeout=timeout)
+        except Exception:
+            return None
+        
         for selector in selectors:
+            element = await self._page.query_selector(selector)
+            if element:
+                logger.debug("[Browser] Found element with: %s", selector)
+                return element
+        return None
+    
+    async def _wait_for_any_selector_via_mutation(self, selectors: list, timeout_ms: int) -> Optional[str]:
+        """
+        Wait in the page until one of the selectors matches a ready element.
+        
+        Args:
+            selectors: List of CSS selectors to watch
+            timeout_ms: Maximum wait time in ms
+            
+        Returns:
+            The matching selector, or None on timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_ms / 1000
+        remaining_ms = timeout_ms
+
+        while remaining_ms > 0:
             try:
-                element = await self._page.wait_for_selector(selector, timeout=timeout)
-                if element:
-                    logger.info(f"[Browser] Found element with: {selector}")
-                    return element
-            except:
-                continue
+                return await self._page.evaluate(
+                    "(a) => window.__gem_waitFor(a)", [selectors, remaining_ms]
+                )
+            except Exception as e:
+                # Navigation destroys the execution context mid-wait; the
+                # init script re-installs the helper on the new document
+                if self._page.is_closed():
+                    logger.debug("[Browser] Selector wait aborted, page closed: %s", e)
+                    return None
+                logger.debug("[Browser] Selector wait interrupted, retrying: %s", e)
+
+            remaining_ms = int((deadline - loop.time()) * 1000)
+            if remaining_ms <= 0:
+                break
+            try:
+                await self._page.wait_for_load_state("domcontentloaded", timeout=remaining_ms)
+            except Exception as e:
+                logger.debug("[Browser] Load state wait failed: %s", e)
+            remaining_ms = int((deadline - loop.time()) * 1000)
+
         return None
     
+    async def _wait_for_verification_step(self, previous_url: str, timeout_ms: int) -> bool:
+        """
+        Wait until the page navigates away or the code input appears.
+        
+        Args:
+            previous_url: URL before submitting the email
+            timeout_ms: Maximum wait time in ms
+            
+        Returns:
+            True if the verification step was reached
+        """
+        url_task = asyncio.ensure_future(self._page.wait_for_url(
+            lambda url: url != previous_url,
+            wait_until="commit",
+            timeout=timeout_ms
+        ))
+        pin_task = asyncio.ensure_future(
+            self._wait_for_any_selector_via_mutation(self.CODE_SELECTORS, timeout_ms)
+        )
+        pending = {url_task, pin_task}
+        changed = False
+        
+        try:
+            while pending and not changed:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if url_task in done and url_task.exception() is None:
+                    logger.info("[Browser] Page URL changed: %s", self._page.url)
+                    logger.info("[Browser] Page navigated to verification step")
+                    changed = True
+                elif pin_task in done and pin_task.result():
+                    logger.info("[Browser] Verification code input found")
+                    changed = True
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        return changed
+    
+    async def _wait_for_page_condition(self, expression: str, arg=None, timeout_ms: int = 5000) -> bool:
+        """
+        Wait until a page predicate turns truthy, checked on animation frames.
+        
+        Args:
+            expression: JS function evaluated in the page
+            arg: Optional argument passed to the function
+            timeout_ms: Maximum wait time in milliseconds
+            
+        Returns:
+            True if the condition was met, False on timeout
+        """
+        try:
+            await self._page.wait_for_function(expression, arg=arg, timeout=timeout_ms)
+            return True
+        except Exception:
+            return False
+    
     async def _input_via_js(self, value: str, selectors: list) -> bool:
         """
         Input value using JavaScript (more reliable than native input).
@@ -229,26 +728,10 @@ class BrowserController:
         """
         try:
             # Use Playwright's argument passing for safety
-            result = await self._page.evaluate('''
-                ([selectors, value]) => {
-                    for (const selector of selectors) {
-                        try {
-                            let el = document.querySelector(selector);
-                            if (el) {
-                                el.focus();
-                                el.value = value;
-                                el.dispatchEvent(new Event("input", {bubbles: true}));
-                                el.dispatchEvent(new Event("change", {bubbles: true}));
-                                return el.value === value;
-                            }
-                        } catch (e) {}
-                    }
-                    return false;
-                }
-            ''', [selectors, value])
+            result = await self._page.evaluate("(a) => window.__gem_input(a)", [selectors, value])
             return result
         except Exception as e:
-            logger.warning(f"[Browser] JS input failed: {e}")
+            logger.warning("[Browser] JS input failed: %s", e)
             return False
     
     async def _click_via_js(self, selectors: list) -> bool:
@@ -262,20 +745,7 @@ class BrowserController:
             True if successful
         """
         try:
-            result = await self._page.evaluate('''
-                (selectors) => {
-                    for (const selector of selectors) {
-                        try {
-                            let el = document.querySelector(selector);
-                            if (el) {
-                                el.click();
-                                return true;
-                            }
-                        } catch (e) {}
-                    }
-                    return false;
-                }
-            ''', selectors)
+            result = await self._page.evaluate("(s) => window.__gem_click(s)", selectors)
             return result
         except:
             return False
@@ -294,17 +764,19 @@ class BrowserController:
         """
         try:
             # Navigate to login page with retry mechanism
-            logger.info(f"[Browser] Navigating to {self.GEMINI_LOGIN_URL}")
+            logger.info("[Browser] Navigating to %s", self.GEMINI_LOGIN_URL)
             
             max_retries = 3
             last_error = None
             
             for attempt in range(max_retries):
                 try:
+                    # "commit" returns once the document exists; the email
+                    # input wait below covers the rest of the load
                     await self._page.goto(
                         self.GEMINI_LOGIN_URL, 
-                        wait_until="domcontentloaded",
-                        timeout=60000
+                        wait_until="commit",
+                        timeout=30000
                     )
                     # Success, break the retry loop
                     break
@@ -312,10 +784,11 @@ class BrowserController:
                     last_error = e
                     error_msg = str(e)
                     if "net::ERR_CONNECTION_CLOSED" in error_msg or "net::ERR_CONNECTION_RESET" in error_msg:
-                        logger.warning(f"[Browser] Connection error (attempt {attempt + 1}/{max_retries}): {error_msg[:50]}...")
+                        logger.warning("[Browser] Connection error (attempt %s/%s): %s...", attempt + 1, max_retries, error_msg[:50])
                         if attempt < max_retries - 1:
-                            logger.info(f"[Browser] Retrying in 3 seconds...")
-                            await asyncio.sleep(3)
+                            delay = 2 ** attempt
+                            logger.info("[Browser] Retrying in %s seconds...", delay)
+                            await asyncio.sleep(delay)
                             continue
                     # For other errors or max retries reached, raise
                     raise
@@ -324,59 +797,43 @@ class BrowserController:
                 if last_error:
                     raise last_error
             
-            # Wait for page to stabilize
-            await asyncio.sleep(3)
-            
             # Find email input using multiple selectors
             email_input = await self._find_element_by_selectors(
                 self.EMAIL_SELECTORS, 
-                timeout=10000
+                timeout=20000,
+                combined=self.EMAIL_SELECTOR_CSS
             )
             
             if not email_input:
                 logger.error("[Browser] Email input not found")
                 return False
             
-            # Wait for element to be stable (check with JS)
-            for _ in range(10):
-                try:
-                    stable = await self._page.evaluate('''
-                        (function() {
-                            let el = document.getElementById("email-input") ||
-                                     document.querySelector('input[name="loginHint"]') ||
-                                     document.querySelector('input[type="email"]') ||
-                                     document.querySelector('input[type="text"]');
-                            if (!el) return false;
-                            let style = window.getComputedStyle(el);
-                            return !el.disabled && !el.readOnly && style.visibility !== 'hidden';
-                        })()
-                    ''')
-                    if stable:
-                        break
-                except:
-                    pass
-                await asyncio.sleep(0.3)
+            # Wait for element to be stable (enabled, writable, visible);
+            # this replaces a fixed settle delay after navigation
+            await self._wait_for_any_selector_via_mutation(self.EMAIL_SELECTORS, 3000)
             
             # Try JS input first (more reliable)
             js_success = await self._input_via_js(email, self.EMAIL_SELECTORS)
             
             if not js_success:
-                # Fallback to native input
-                logger.info("[Browser] Using fallback native input")
-                await email_input.click()
-                await asyncio.sleep(0.2)
-                await email_input.fill("")  # Clear
-                await asyncio.sleep(0.2)
-                await email_input.type(email, delay=20)  # Type character by character
+                # Fallback: set the value on the located element directly
+                logger.info("[Browser] Using fallback element input")
+                await email_input.evaluate(_SET_VALUE_JS, email)
             
-            logger.info(f"[Browser] Entered email: {email}")
+            logger.info("[Browser] Entered email: %s", email)
             
-            # Click continue button
-            await asyncio.sleep(0.5)
+            # Wait for the continue button to become clickable
+            await self._wait_for_page_condition(
+                "(s) => window.__gem_buttonReady(s)", self.CONTINUE_BUTTON_CSS
+            )
             
             # Remember current URL for change detection
             current_url = self._page.url
             
+            # Arm the navigation / code-input wait before clicking so nothing
+            # fired by the click is missed (same idea as expect_navigation)
+            step_task = asyncio.ensure_future(self._wait_for_verification_step(current_url, 8000))
+            
             # Try multiple methods to click continue
             clicked = await self._click_via_js(self.CONTINUE_SELECTORS)
             
@@ -384,7 +841,8 @@ class BrowserController:
                 # Try native click
                 continue_btn = await self._find_element_by_selectors(
                     self.CONTINUE_SELECTORS, 
-                    timeout=5000
+                    timeout=5000,
+                    combined=self.CONTINUE_SELECTOR_CSS
                 )
                 if continue_btn:
                     await continue_btn.click()
@@ -399,53 +857,27 @@ class BrowserController:
             
             # Wait for page change (URL change or pin input appears)
             # This is critical for headless mode
-            page_changed = False
-            for attempt in range(15):  # Wait up to 15 seconds
-                await asyncio.sleep(1)
-                new_url = self._page.url
-                
-                # Check if URL changed (navigation happened)
-                if new_url != current_url:
-                    logger.info(f"[Browser] Page URL changed: {new_url}")
-                    logger.info(f"[Browser] Page navigated to verification step")
-                    page_changed = True
-                    break
-                
-                # Check if pin input appeared (same page navigation)
-                pin_input = await self._find_element_by_selectors(
-                    self.CODE_SELECTORS,
-                    timeout=500
-                )
-                if pin_input:
-                    logger.info(f"[Browser] Verification code input found")
-                    page_changed = True
-                    break
-                
-                # Check if still on email input (button click may have failed)
-                if attempt == 5:
-                    # Try clicking again after 5 seconds
-                    logger.warning("[Browser] Page not changed, retrying click...")
-                    await self._click_via_js(self.CONTINUE_SELECTORS)
-                    await email_input.press("Enter")
+            page_changed = await step_task
+            
+            if not page_changed:
+                # Button click may have failed, try clicking again
+                logger.warning("[Browser] Page not changed, retrying click...")
+                await self._click_via_js(self.CONTINUE_SELECTORS)
+                await email_input.press("Enter")
+                page_changed = await self._wait_for_verification_step(current_url, 10000)
             
             # Only check if email was cleared if page did NOT change
             # (to handle the case where submit clears the field without navigating)
             if not page_changed:
                 try:
-                    current_value = await self._page.evaluate('''
-                        (function() {
-                            let el = document.getElementById("email-input") ||
-                                     document.querySelector('input[name="loginHint"]') ||
-                                     document.querySelector('input[type="email"]') ||
-                                     document.querySelector('input[type="text"]');
-                            return el ? el.value : "";
-                        })()
-                    ''')
+                    current_value = await self._page.evaluate("(s) => window.__gem_readValue(s)", self.EMAIL_SELECTORS)
                     
                     if not current_value:
                         logger.warning("[Browser] Email cleared after submit, re-inputting")
                         await self._input_via_js(email, self.EMAIL_SELECTORS)
-                        await asyncio.sleep(0.3)
+                        await self._wait_for_page_condition(
+                            "(s) => window.__gem_buttonReady(s)", self.CONTINUE_BUTTON_CSS, 2000
+                        )
                         await self._click_via_js(self.CONTINUE_SELECTORS)
                 except Exception:
                     pass
@@ -453,7 +885,7 @@ class BrowserController:
             return True
             
         except Exception as e:
-            logger.error(f"[Browser] Login failed: {e}")
+            logger.error("[Browser] Login failed: %s", e)
             return False
     
     async def enter_verification_code(self, code: str) -> bool:
@@ -468,87 +900,56 @@ class BrowserController:
         """
         try:
             # Wait for code input using multiple selectors
-            code_input = None
-            for _ in range(10):
-                code_input = await self._find_element_by_selectors(
-                    self.CODE_SELECTORS,
-                    timeout=3000
-                )
-                if code_input:
-                    break
-                await asyncio.sleep(0.5)
-            
-            if not code_input:
+            selector = await self._wait_for_any_selector_via_mutation(self.CODE_SELECTORS, 30000)
+            if not selector:
                 logger.error("[Browser] Code input not found")
                 return False
             
-            # Input code
-            await code_input.click()
-            await asyncio.sleep(0.2)
-            await code_input.fill(code)
-            
-            # Dispatch events
-            await self._page.evaluate('''
-                (function() {
-                    let el = document.querySelector("input[name=pinInput]") || 
-                             document.querySelector("input[type=tel]");
-                    if(el) {
-                        el.dispatchEvent(new Event("input", {bubbles: true}));
-                        el.dispatchEvent(new Event("change", {bubbles: true}));
-                    }
-                })()
-            ''')
+            # Input code, dispatch events and click verify in one round-trip
+            status = await self._page.evaluate(
+                "(a) => window.__gem_submitCode(a)", [selector, code]
+            )
+            if status == "missing":
+                logger.error("[Browser] Code input not found")
+                return False
             
             logger.info("[Browser] Entered verification code")
             
-            # Find and click verify button (avoid resend buttons)
-            await asyncio.sleep(0.5)
-            
-            # Get all buttons and find the verify button (not resend)
-            clicked = await self._page.evaluate('''
-                (function() {
-                    let buttons = document.querySelectorAll("button");
-                    for (let btn of buttons) {
-                        let text = btn.textContent || "";
-                        // Skip resend buttons
-                        if (text.includes("重新") || text.includes("发送") || 
-                            text.toLowerCase().includes("resend")) {
-                            continue;
-                        }
-                        if (text.trim()) {
-                            btn.click();
-                            return true;
-                        }
-                    }
-                    return false;
-                })()
-            ''')
-            
-            if not clicked:
-                await code_input.press("Enter")
-                logger.info("[Browser] Pressed Enter as fallback")
-            else:
+            if status == "clicked":
                 logger.info("[Browser] Clicked verify button")
+            else:
+                # Verify button not enabled yet, wait for it and click
+                await self._wait_for_page_condition("window.__gem_verifyReady()")
+                clicked = await self._page.evaluate("window.__gem_clickVerify()")
+                
+                if not clicked:
+                    await self._page.press(selector, "Enter")
+                    logger.info("[Browser] Pressed Enter as fallback")
+                else:
+                    logger.info("[Browser] Clicked verify button")
             
             # Wait for navigation to complete
-            for _ in range(10):
-                await asyncio.sleep(3)
-                curr_url = self._page.url
-                if any(kw in curr_url for kw in ["home", "admin", "setup", "create", "dashboard"]):
-                    logger.info("[Browser] Login successful, navigated to home")
-                    return True
+            try:
+                await self._page.wait_for_url(
+                    lambda u: bool(_VERIFY_OK_RE.search(u)),
+                    wait_until="commit",
+                    timeout=30000
+                )
+                logger.info("[Browser] Login successful, navigated to home")
+                return True
+            except Exception:
+                pass
             
             # Check for failure indicators
             curr_url = self._page.url
-            fail_keywords = ["verify", "oob", "error"]
-            if any(kw in curr_url for kw in fail_keywords):
+            if _LOGIN_FAIL_RE.search(curr_url):
                 logger.error("[Browser] Verification failed - still on verify page")
                 return False
             
             return True
             
         except Exception as e:
-            logger.error(f"[Browser] Verification failed: {e}")
+            logger.error("[Browser] Verification failed: %s", e)
             return False
     
     async def extract_cookies(self) -> dict:
@@ -571,59 +972,59 @@ class BrowserController:
             logger.info("[Browser] Extracting account configuration...")
             
             # Wait for page to have correct URL
-            for i in range(15):
-                current_url = self._page.url
-                if '/cid/' in current_url or 'csesidx=' in current_url:
-                    logger.info(f"[Browser] Found target URL: {current_url[:80]}...")
-                    break
-                await asyncio.sleep(2)
+            try:
+                await self._page.wait_for_url(
+                    lambda u: '/cid/' in u or 'csesidx=' in u,
+                    wait_until="commit",
+                    timeout=30000
+                )
+                logger.info("[Browser] Found target URL: %s...", self._page.url[:80])
+            except Exception:
+                logger.warning("[Browser] Target URL not reached, extracting anyway")
             
-            # Parse URL for config_id and csesidx
-            current_url = self._page.url
-            parsed_url = urllib.parse.urlparse(current_url)
-            path_parts = parsed_url.path.split('/')
+            # Read the live URL and the cookies for the Gemini origin together
+            current_url, cookies = await asyncio.gather(
+                self._page.evaluate("location.href"),
+                self._context.cookies(urls=[self.GEMINI_LOGIN_URL])
+            )
             
             # Extract config_id from path (e.g., /home/cid/XXXXX)
-            if 'cid' in path_parts:
-                cid_index = path_parts.index('cid')
-                if len(path_parts) > cid_index + 1:
-                    result["config_id"] = path_parts[cid_index + 1]
-                    logger.info(f"[Browser] config_id: {result['config_id']}")
+            match = _CONFIG_ID_RE.search(current_url)
+            if match:
+                result["config_id"] = match.group(1)
+                logger.info("[Browser] config_id: %s", result['config_id'])
             
             # Extract csesidx from query params
-            query_params = urllib.parse.parse_qs(parsed_url.query)
-            csesidx = query_params.get('csesidx', [None])[0]
-            if csesidx:
-                result["csesidx"] = csesidx
-                logger.info(f"[Browser] csesidx: {csesidx}")
-            
-            # Get cookies from browser context
-            cookies = await self._context.cookies()
-            
-            for cookie in cookies:
-                name = cookie.get("name", "")
-                value = cookie.get("value", "")
+            match = _CSESIDX_RE.search(current_url)
+            if match:
+                result["csesidx"] = urllib.parse.unquote_plus(match.group(1))
+                logger.info("[Browser] csesidx: %s", result['csesidx'])
+            
+            # Index cookies by name
+            by_name = {c["name"]: c for c in cookies}
+            
+            sec = by_name.get("__Secure-C_SES")
+            if sec:
+                result["secure_c_ses"] = sec["value"]
+                logger.info("[Browser] __Secure-C_SES: %s...", sec['value'][:50])
                 
-                if name == "__Secure-C_SES":
-                    result["secure_c_ses"] = value
-                    logger.info(f"[Browser] __Secure-C_SES: {value[:50]}...")
-                    
-                    # Get expiry time
-                    expiry = cookie.get("expires")
-                    if expiry:
-                        # Cookie expiry - 12 hours = recommended update time
-                        adjusted_time = datetime.fromtimestamp(expiry - 43200)
-                        result["expires_at"] = adjusted_time.strftime("%Y-%m-%d %H:%M:%S")
-                        logger.info(f"[Browser] expires_at: {result['expires_at']}")
-                        
-                elif name == "__Host-C_OSES":
-                    result["host_c_oses"] = value
-                    logger.info(f"[Browser] __Host-C_OSES: {value[:50]}...")
+                # Get expiry time
+                expiry = sec.get("expires")
+                if expiry and expiry > 0:
+                    # Cookie expiry - 12 hours = recommended update time
+                    adjusted_time = datetime.fromtimestamp(expiry - 43200)
+                    result["expires_at"] = adjusted_time.strftime("%Y-%m-%d %H:%M:%S")
+                    logger.info("[Browser] expires_at: %s", result['expires_at'])
+            
+            host = by_name.get("__Host-C_OSES")
+            if host:
+                result["host_c_oses"] = host["value"]
+                logger.info("[Browser] __Host-C_OSES: %s...", host['value'][:50])
             
             # Default expiry if not found
             if not result["expires_at"]:
                 result["expires_at"] = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-                logger.info(f"[Browser] Using default expires_at: {result['expires_at']}")
+                logger.info("[Browser] Using default expires_at: %s", result['expires_at'])
             
             if result["secure_c_ses"]:
                 logger.info("[Browser] Extraction completed")
@@ -633,7 +1034,7 @@ class BrowserController:
             return result
             
         except Exception as e:
-            logger.error(f"[Browser] Cookie extraction failed: {e}")
+            logger.error("[Browser] Cookie extraction failed: %s", e)
             return result
     
     async def wait_for_login_complete(self, timeout: int = 60) -> bool:
@@ -647,12 +1048,12 @@ class BrowserController:
             True if login completed
         """
         try:
-            for _ in range(timeout // 3):
-                curr_url = self._page.url
-                if any(kw in curr_url for kw in ["home", "admin", "setup", "create", "dashboard", "cid"]):
-                    return True
-                await asyncio.sleep(3)
-            return False
+            await self._page.wait_for_url(
+                lambda u: bool(_LOGIN_OK_RE.search(u)),
+                wait_until="commit",
+                timeout=timeout * 1000
+            )
+            return True
         except Exception:
             return False
 
@@ -668,9 +1069,11 @@ async def create_browser_controller(
         proxy_url: Optional proxy URL, uses config default if not specified
         headless: Optional headless mode, uses config default if not specified
     """
+    headless = headless if headless is not None else get_config().browser_headless
     controller = BrowserController(
         proxy_url=proxy_url,
-        headless=headless if headless is not None else config.browser_headless
+        headless=headless,
+        shared_browser=get_shared_browser(headless) if get_config().browser_shared else None
     )
     await controller.start()
     return controller
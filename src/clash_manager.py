@@ -5,16 +5,34 @@ Handles starting/stopping Clash process and proxy node selection.
 
 import subprocess
 import requests
+from requests.adapters import HTTPAdapter
 import yaml
+import hashlib
+import functools
+import heapq
 import time
 import os
 import atexit
 import sys
+import threading
 import random
 import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from typing import Optional
 
-from .utils import logger
+from .utils import logger, json_loads
+
+@functools.lru_cache(maxsize=4096)
+def _quote_name(name: str) -> str:
+    """URL-encode a proxy or group name for the Clash API path (cached)."""
+    return urllib.parse.quote(name, safe="")
+
+
+# libyaml-backed loader/dumper when available, much faster on large configs
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
 
 
 class ClashManager:
@@ -23,13 +41,32 @@ class ClashManager:
     # Keywords to skip when selecting nodes
     SKIP_KEYWORDS = ["自动选择", "故障转移", "DIRECT", "REJECT", "剩余", "到期", "官网"]
     
+    # Seconds a node is skipped after being reported as failed
+    NODE_FAILURE_COOLDOWN = 300
+    
+    # Seconds a node that passed find_healthy_node, or last carried a
+    # successful account, is reused without re-probing
+    HEALTHY_NODE_TTL = 30
+    
+    # Latency test target and the matching /delay query for the default timeout
+    LATENCY_TEST_URL = "http://www.gstatic.com/generate_204"
+    LATENCY_TEST_PARAMS = {"timeout": 5000, "url": LATENCY_TEST_URL}
+    
+    # First line of the runtime config, records what it was generated from
+    FINGERPRINT_PREFIX = "# source-fingerprint: "
+    
+    # Number of nodes whose latency is probed in parallel
+    LATENCY_PROBE_WORKERS = 16
+    
     def __init__(
         self,
         executable: str = "mihomo",
         config: str = "local.yaml",
         runtime_config: str = "config_runtime.yaml",
         port: int = 17890,
-        api_port: int = 29090
+        api_port: int = 29090,
+        latency_probe_concurrency: int = 8,
+        latency_probe_jitter_ms: tuple[int, int] = (0, 300)
     ):
         """
         Initialize Clash manager.
@@ -40,6 +77,9 @@ class ClashManager:
             runtime_config: Path to generated runtime config
             port: Mixed proxy port
             api_port: Clash API port
+            latency_probe_concurrency: Maximum latency probes in flight at once
+            latency_probe_jitter_ms: Random delay range before each probe, so
+                bursts do not trip the provider's rate limits
         """
         self.executable = executable
         self.config = config
@@ -48,20 +88,74 @@ class ClashManager:
         self.api_port = api_port
         self.api_url = f"http://127.0.0.1:{api_port}"
         self.process: Optional[subprocess.Popen] = None
+        self.latency_probe_jitter_ms = latency_probe_jitter_ms
+        self._probe_slots = threading.BoundedSemaphore(max(latency_probe_concurrency, 1))
+        # Serializes node selection (switch_node, select + Google check),
+        # which changes the group's global state
+        self._select_lock = threading.Lock()
+        
+        # Node name -> monotonic time until which it is skipped
+        self._node_cooldowns: dict[str, float] = {}
+        
+        # Node name -> Selector group containing it, filled on demand
+        self._node_to_group: dict[str, str] = {}
+        
+        # Node name -> monotonic time it last passed find_healthy_node or
+        # was reported working through mark_node_ok
+        self._healthy_nodes: dict[str, float] = {}
+        self._healthy_rr = 0
         
         # Create a session that bypasses proxy for local API access
         self._api_session = requests.Session()
         self._api_session.trust_env = False  # Ignore proxy env vars
+        # Keep one pooled connection per parallel latency probe
+        self._api_session.mount("http://", HTTPAdapter(
+            pool_maxsize=self.LATENCY_PROBE_WORKERS
+        ))
+        
+        # Pooled session that ignores env proxies and goes through Clash only
+        self._proxy_session = requests.Session()
+        self._proxy_session.trust_env = False
+        self._proxy_session.proxies = {
+            "http": f"http://127.0.0.1:{self.port}",
+            "https": f"http://127.0.0.1:{self.port}"
+        }
+        proxy_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        self._proxy_session.mount("http://", proxy_adapter)
+        self._proxy_session.mount("https://", proxy_adapter)
         
         self._prepare_config()
     
+    def _config_fingerprint(self) -> str:
+        """Hash of everything the runtime config is generated from."""
+        stat = os.stat(self.config)
+        source = f"{os.path.abspath(self.config)}|{stat.st_mtime_ns}|{stat.st_size}|{self.port}|{self.api_port}"
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+    
+    def _runtime_config_fingerprint(self) -> Optional[str]:
+        """Read the fingerprint header of the existing runtime config, if any."""
+        try:
+            with open(self.runtime_config, "r", encoding="utf-8") as f:
+                first_line = f.readline()
+        except OSError:
+            return None
+        if first_line.startswith(self.FINGERPRINT_PREFIX):
+            return first_line[len(self.FINGERPRINT_PREFIX):].strip()
+        return None
+    
     def _prepare_config(self) -> None:
         """Prepare runtime config with correct ports and necessary routing rules."""
         if not os.path.exists(self.config):
             raise FileNotFoundError(f"Config not found: {self.config}")
         
+        # Skip the parse/dump if the runtime config was built from the same input
+        fingerprint = self._config_fingerprint()
+        if self._runtime_config_fingerprint() == fingerprint:
+            logger.info("[Clash] Config unchanged, reusing: %s", self.runtime_config)
+            return
+        
         with open(self.config, "r", encoding="utf-8") as f:
-            cfg = yaml.safe_load(f)
+            cfg = yaml.load(f, Loader=_YamlLoader)
         
         # Override port settings
         cfg["mixed-port"] = self.port
@@ -82,7 +176,7 @@ class ClashManager:
                         "proxies": proxy_names
                     }
                 ]
-                logger.info(f"[Clash] Auto-generated proxy-group with {len(proxy_names)} nodes")
+                logger.info("[Clash] Auto-generated proxy-group with %s nodes", len(proxy_names))
         
         # Auto-generate rules if not present - route all traffic through proxy
         if "rules" not in cfg or not cfg["rules"]:
@@ -90,14 +184,20 @@ class ClashManager:
             logger.info("[Clash] Auto-generated rules: MATCH -> 🚀 节点选择")
         
         with open(self.runtime_config, "w", encoding="utf-8") as f:
-            yaml.safe_dump(cfg, f, allow_unicode=True)
+            f.write(f"{self.FINGERPRINT_PREFIX}{fingerprint}\n")
+            yaml.dump(cfg, f, Dumper=_YamlDumper, allow_unicode=True)
         
-        logger.info(f"[Clash] Config ready: {self.runtime_config}")
+        logger.info("[Clash] Config ready: %s", self.runtime_config)
     
-    def start(self) -> None:
-        """Start Clash process."""
+    def start(self) -> bool:
+        """
+        Start Clash process.
+        
+        Returns:
+            True if Clash is running and its API responds
+        """
         if self.process:
-            return
+            return True
         
         cmd = [self.executable, "-f", self.runtime_config]
         
@@ -111,17 +211,21 @@ class ClashManager:
         
         self.process = subprocess.Popen(cmd, **kwargs)
         
-        # Wait for Clash to start
-        for _ in range(10):
+        # Wait for Clash to start, polling quickly at first and backing off
+        delay = 0.025
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
             try:
-                self._api_session.get(self.api_url, timeout=1)
+                self._api_session.get(self.api_url, timeout=0.5)
                 logger.info("[Clash] Started successfully")
-                return
+                return True
             except Exception:
-                time.sleep(1)
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
         
         logger.error("[Clash] Start failed")
         self.stop()
+        return False
     
     def stop(self) -> None:
         """Stop Clash process."""
@@ -137,7 +241,7 @@ class ClashManager:
             res = self._api_session.get(url, timeout=5).json()
             return res.get("proxies", {})
         except Exception as e:
-            logger.error(f"[Clash] Failed to get proxies: {e}")
+            logger.error("[Clash] Failed to get proxies: %s", e)
             return {}
     
     def test_latency(self, proxy_name: str, timeout: int = 5000) -> int:
@@ -152,12 +256,11 @@ class ClashManager:
             Latency in ms, or -1 if failed
         """
         try:
-            encoded_name = urllib.parse.quote(proxy_name)
-            url = f"{self.api_url}/proxies/{encoded_name}/delay"
-            params = {
-                "timeout": timeout,
-                "url": "http://www.gstatic.com/generate_204"
-            }
+            url = f"{self.api_url}/proxies/{_quote_name(proxy_name)}/delay"
+            if timeout == self.LATENCY_TEST_PARAMS["timeout"]:
+                params = self.LATENCY_TEST_PARAMS
+            else:
+                params = {"timeout": timeout, "url": self.LATENCY_TEST_URL}
             res = self._api_session.get(url, params=params, timeout=6)
             if res.status_code == 200:
                 return res.json().get("delay", 0)
@@ -177,13 +280,12 @@ class ClashManager:
             True if successful
         """
         try:
-            encoded_group = urllib.parse.quote(group_name)
-            url = f"{self.api_url}/proxies/{encoded_group}"
+            url = f"{self.api_url}/proxies/{_quote_name(group_name)}"
             self._api_session.put(url, json={"name": proxy_name}, timeout=5)
-            logger.info(f"[Clash] Switched to: {proxy_name}")
+            logger.debug("[Clash] Switched to: %s", proxy_name)
             return True
         except Exception as e:
-            logger.error(f"[Clash] Failed to switch proxy: {e}")
+            logger.error("[Clash] Failed to switch proxy: %s", e)
             return False
     
     def switch_node(self, proxy_name: str) -> bool:
@@ -198,21 +300,39 @@ class ClashManager:
             True if successful
         """
         try:
-            proxies = self.get_proxies()
+            # Proxy topology is stable during a run, only re-read it on a miss
+            group_name = self._node_to_group.get(proxy_name)
+            if group_name is None:
+                group_name = self._refresh_topology().get(proxy_name)
             
-            # Find group containing this proxy
-            for group_name, group_info in proxies.items():
-                if group_info.get("type") == "Selector":
-                    all_nodes = group_info.get("all", [])
-                    if proxy_name in all_nodes:
-                        return self.select_proxy(group_name, proxy_name)
+            if group_name is not None:
+                # Workers call this from threads; don't interleave with a
+                # find_healthy_node check selecting in the same group
+                with self._select_lock:
+                    return self.select_proxy(group_name, proxy_name)
             
-            logger.error(f"[Clash] Proxy node not found: {proxy_name}")
+            logger.error("[Clash] Proxy node not found: %s", proxy_name)
             return False
         except Exception as e:
-            logger.error(f"[Clash] Failed to switch node: {e}")
+            logger.error("[Clash] Failed to switch node: %s", e)
             return False
     
+    def _refresh_topology(self) -> dict[str, str]:
+        """
+        Rebuild the node -> Selector group mapping from the Clash API.
+        
+        Returns:
+            The refreshed mapping
+        """
+        mapping = {}
+        for group_name, group_info in self.get_proxies().items():
+            if group_info.get("type") == "Selector":
+                for node in group_info.get("all", []):
+                    # Keep the first group listing a node, as the old scan did
+                    mapping.setdefault(node, group_name)
+        self._node_to_group = mapping
+        return mapping
+    
     def _test_google_access(self, proxy_name: str) -> bool:
         """
         Test if the proxy can access Google services.
@@ -221,39 +341,81 @@ class ClashManager:
             True if accessible
         """
         try:
-            time.sleep(1)
-            
-            # Create a session that ignores env proxy and uses Clash proxy only
-            test_session = requests.Session()
-            test_session.trust_env = False  # Ignore env proxy vars
-            test_session.proxies = {
-                "http": f"http://127.0.0.1:{self.port}",
-                "https": f"http://127.0.0.1:{self.port}"
-            }
-            
-            logger.info(f"   Testing [{proxy_name}]...", )
-            # Use gstatic 204 endpoint for faster testing (same as reference project)
-            resp = test_session.get(
-                "http://www.gstatic.com/generate_204",
-                timeout=5
+            logger.info("   Testing [%s]...", proxy_name)
+            # Use gstatic 204 endpoint for faster testing (same as reference project);
+            # only the status matters, so HEAD with a short connect timeout
+            resp = self._proxy_session.head(
+                self.LATENCY_TEST_URL,
+                timeout=(2, 3),
+                allow_redirects=False
             )
             
-            if resp.status_code in [200, 204]:
-                logger.info(f" ✅ PASS (status={resp.status_code})")
+            # A redirect still proves the node reaches Google
+            if resp.status_code in (200, 204, 301, 302):
+                logger.info(" ✅ PASS (status=%s)", resp.status_code)
                 return True
             else:
-                logger.warning(f" ❌ Blocked (status={resp.status_code})")
+                logger.warning(" ❌ Blocked (status=%s)", resp.status_code)
                 return False
         except Exception as e:
-            logger.warning(f" ❌ Timeout ({type(e).__name__}: {e})")
+            logger.warning(" ❌ Timeout (%s: %s)", type(e).__name__, e)
             return False
     
-    def find_healthy_node(self, group_name: Optional[str] = None) -> Optional[str]:
+    def _probe_latency_throttled(self, proxy_name: str) -> int:
+        """Test latency after a random delay, within the concurrency cap."""
+        low, high = self.latency_probe_jitter_ms
+        if high > 0:
+            time.sleep(random.uniform(low, high) / 1000)
+        with self._probe_slots:
+            return self.test_latency(proxy_name)
+    
+    def _select_and_test(self, group_name: str, proxy_name: str) -> bool:
+        """Select a node and check Google access through it, one at a time."""
+        with self._select_lock:
+            self.select_proxy(group_name, proxy_name)
+            self._wait_for_selection(group_name, proxy_name)
+            return self._test_google_access(proxy_name)
+    
+    def _wait_for_selection(self, group_name: str, proxy_name: str, timeout: float = 0.5) -> None:
+        """
+        Wait until the group reports the node as selected.
+        
+        Args:
+            group_name: Name of the proxy group
+            proxy_name: Name of the node that was selected
+            timeout: Maximum wait time in seconds
+        """
+        url = f"{self.api_url}/proxies/{_quote_name(group_name)}"
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                res = self._api_session.get(url, timeout=1)
+                if json_loads(res.content).get("now") == proxy_name:
+                    return
+                if time.monotonic() >= deadline:
+                    return
+                time.sleep(0.05)
+        except Exception:
+            # API unavailable, give the switch a short fixed settle time
+            time.sleep(0.3)
+    
+    def find_healthy_node(
+        self,
+        group_name: Optional[str] = None,
+        max_workers: Optional[int] = None
+    ) -> Optional[str]:
         """
         Find a healthy proxy node that can access Google.
         
+        Latency is probed for all candidates in parallel. As results come
+        in, the fastest reachable node so far is selected and checked for
+        Google access; checks run one at a time since selecting a node
+        changes the group's global state. The first node that passes wins
+        and the remaining probes are abandoned.
+        
         Args:
             group_name: Optional proxy group name, auto-detect if not provided
+            max_workers: Parallel latency probes, defaults to LATENCY_PROBE_WORKERS
             
         Returns:
             Name of healthy node, or None if not found
@@ -272,30 +434,124 @@ class ClashManager:
             logger.error("[Clash] No proxy group found")
             return None
         
-        # Get all nodes and shuffle for randomness
+        # Get all nodes and shuffle so equal-latency nodes rotate
         all_nodes = proxies[group_name].get("all", [])
         random.shuffle(all_nodes)
         
-        for node in all_nodes:
-            # Skip system/utility nodes
-            if any(kw in node for kw in self.SKIP_KEYWORDS):
-                continue
-            
-            # Test latency
-            delay = self.test_latency(node)
-            if delay <= 0:
-                continue
-            
-            # Select this node
-            self.select_proxy(group_name, node)
+        # Skip system/utility nodes and nodes that recently failed
+        candidates = [
+            node for node in all_nodes
+            if not any(kw in node for kw in self.SKIP_KEYWORDS)
+            and not self._in_cooldown(node)
+        ]
+        
+        workers = self.LATENCY_PROBE_WORKERS if max_workers is None else max_workers
+        probe_pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+        check_pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            # Latency probe futures -> node, and reachable nodes by delay
+            probes = {probe_pool.submit(self._probe_latency_throttled, node): node for node in candidates}
+            reachable: list[tuple[int, str]] = []
+            check: Optional[Future] = None
+            check_node = None
             
-            # Test Google access
-            if self._test_google_access(node):
-                return node
+            while probes or reachable or check:
+                # Start checking the fastest node seen so far
+                if check is None and reachable:
+                    _, check_node = heapq.heappop(reachable)
+                    check = check_pool.submit(self._select_and_test, group_name, check_node)
+                
+                waiting = set(probes)
+                if check is not None:
+                    waiting.add(check)
+                done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    if future is check:
+                        if future.result():
+                            self._healthy_nodes[check_node] = time.monotonic()
+                            return check_node
+                        check = None
+                    else:
+                        node = probes.pop(future)
+                        delay = future.result()
+                        if delay > 0:
+                            heapq.heappush(reachable, (delay, node))
+        finally:
+            # Abandon probes that are no longer needed
+            probe_pool.shutdown(wait=False, cancel_futures=True)
+            check_pool.shutdown(wait=False, cancel_futures=True)
         
         logger.error("[Clash] No healthy node found")
         return None
     
+    def get_healthy_node(self, group_name: Optional[str] = None) -> Optional[str]:
+        """
+        Select a recently verified healthy node, probing only when none is fresh.
+        
+        Nodes that passed find_healthy_node, or were reported working through
+        mark_node_ok, within HEALTHY_NODE_TTL seconds are reused without a
+        new probe. find_healthy_node stops at the first passing node, so this
+        is usually a single node; when several are fresh they are handed out
+        round-robin.
+        
+        Args:
+            group_name: Optional proxy group name, auto-detect if not provided
+            
+        Returns:
+            Name of healthy node, or None if not found
+        """
+        now = time.monotonic()
+        fresh = [
+            node for node, verified_at in list(self._healthy_nodes.items())
+            if now - verified_at < self.HEALTHY_NODE_TTL and not self._in_cooldown(node)
+        ]
+        if fresh:
+            node = fresh[self._healthy_rr % len(fresh)]
+            self._healthy_rr += 1
+            if self.switch_node(node):
+                logger.info("[Clash] Reusing healthy node: %s", node)
+                return node
+            self._healthy_nodes.pop(node, None)
+        
+        return self.find_healthy_node(group_name)
+    
+    def mark_node_ok(self, proxy_name: str) -> None:
+        """
+        Record that a node just carried a successful account.
+        
+        Keeps the node fresh for get_healthy_node, so a working node is not
+        re-probed every HEALTHY_NODE_TTL seconds while it keeps succeeding.
+        
+        Args:
+            proxy_name: Name of the working proxy node
+        """
+        if not self._in_cooldown(proxy_name):
+            self._healthy_nodes[proxy_name] = time.monotonic()
+    
+    def mark_node_failed(self, proxy_name: str, cooldown: Optional[int] = None) -> None:
+        """
+        Skip a node in find_healthy_node for a while after repeated failures.
+        
+        Args:
+            proxy_name: Name of the failing proxy node
+            cooldown: Seconds to skip the node, defaults to NODE_FAILURE_COOLDOWN
+        """
+        cooldown = self.NODE_FAILURE_COOLDOWN if cooldown is None else cooldown
+        self._node_cooldowns[proxy_name] = time.monotonic() + cooldown
+        self._healthy_nodes.pop(proxy_name, None)
+        logger.warning("[Clash] Skipping node for %ss: %s", cooldown, proxy_name)
+    
+    def _in_cooldown(self, proxy_name: str) -> bool:
+        """Check whether a node is still cooling down after a failure."""
+        until = self._node_cooldowns.get(proxy_name)
+        if until is None:
+            return False
+        if time.monotonic() >= until:
+            del self._node_cooldowns[proxy_name]
+            return False
+        return True
+    
     def get_proxy_url(self) -> str:
         """Get the proxy URL for browser/requests."""
         return f"http://127.0.0.1:{self.port}"
@@ -309,7 +565,9 @@ def get_manager(
     executable: str = "mihomo",
     config: str = "local.yaml",
     port: int = 17890,
-    api_port: int = 29090
+    api_port: int = 29090,
+    latency_probe_concurrency: int = 8,
+    latency_probe_jitter_ms: tuple[int, int] = (0, 300)
 ) -> ClashManager:
     """Get or create global ClashManager instance."""
     global _manager_instance
@@ -318,7 +576,9 @@ def get_manager(
             executable=executable,
             config=config,
             port=port,
-            api_port=api_port
+            api_port=api_port,
+            latency_probe_concurrency=latency_probe_concurrency,
+            latency_probe_jitter_ms=latency_probe_jitter_ms
         )
     return _manager_instance
 
@@ -3,12 +3,33 @@ Configuration management module.
 Loads configuration from environment variables with defaults.
 """
 
+import functools
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from pathlib import Path
 from dotenv import load_dotenv
 
-# Load .env file if exists
-load_dotenv()
+
+def _parse_ms_range(value: str) -> tuple[int, int]:
+    """Parse "min,max" (or a single "max") milliseconds into a tuple."""
+    parts = [int(p) for p in value.split(",") if p.strip()]
+    if len(parts) == 1:
+        return (0, parts[0])
+    return (parts[0], parts[1])
+
+
+# Field factories: the environment is read when Config() is created,
+# not when this module is imported
+def _env_str(name: str, default: str):
+    return field(default_factory=lambda: os.getenv(name, default))
+
+
+def _env_int(name: str, default: str):
+    return field(default_factory=lambda: int(os.getenv(name, default)))
+
+
+def _env_bool(name: str, default: str):
+    return field(default_factory=lambda: os.getenv(name, default).lower() == "true")
 
 
 @dataclass
@@ -16,40 +37,71 @@ class Config:
     """Application configuration."""
     
     # Clash/Mihomo settings
-    clash_executable: str = os.getenv("CLASH_EXECUTABLE", "mihomo")
-    clash_config: str = os.getenv("CLASH_CONFIG", "./local.yaml")
-    clash_port: int = int(os.getenv("CLASH_PORT", "17890"))
-    clash_api_port: int = int(os.getenv("CLASH_API_PORT", "29090"))
+    clash_executable: str = _env_str("CLASH_EXECUTABLE", "mihomo")
+    clash_config: str = _env_str("CLASH_CONFIG", "./local.yaml")
+    clash_port: int = _env_int("CLASH_PORT", "17890")
+    clash_api_port: int = _env_int("CLASH_API_PORT", "29090")
+    # Node latency probing: max probes in flight, random delay before each
+    clash_probe_concurrency: int = _env_int("CLASH_PROBE_CONCURRENCY", "8")
+    clash_probe_jitter_ms: tuple = field(
+        default_factory=lambda: _parse_ms_range(os.getenv("CLASH_PROBE_JITTER_MS", "0,300"))
+    )
     
     # Email API
-    email_api_url: str = os.getenv("EMAIL_API_URL", "https://api.duckmail.sbs")
+    email_api_url: str = _env_str("EMAIL_API_URL", "https://api.duckmail.sbs")
     
     # Data push
-    post_target_url: str = os.getenv("POST_TARGET_URL", "")
+    post_target_url: str = _env_str("POST_TARGET_URL", "")
+    # gzip the push body (only if the target accepts Content-Encoding: gzip)
+    post_gzip: bool = _env_bool("POST_GZIP", "false")
     
     # File paths
-    input_csv_path: str = os.getenv("INPUT_CSV_PATH", "./result.csv")
-    output_json_path: str = os.getenv("OUTPUT_JSON_PATH", "./accounts.json")
+    input_csv_path: str = _env_str("INPUT_CSV_PATH", "./result.csv")
+    output_json_path: str = _env_str("OUTPUT_JSON_PATH", "./accounts.json")
     
     # Browser settings
-    browser_headless: bool = os.getenv("BROWSER_HEADLESS", "true").lower() == "true"
+    browser_headless: bool = _env_bool("BROWSER_HEADLESS", "true")
+    # Reuse one Chromium across accounts (disables the Chrome extension)
+    browser_shared: bool = _env_bool("BROWSER_SHARED", "false")
+    # Abort image/font/media requests to speed up page loads
+    browser_block_assets: bool = _env_bool("BROWSER_BLOCK_ASSETS", "false")
+    # Extra Chromium flags, off by default
+    browser_disable_gpu: bool = _env_bool("BROWSER_DISABLE_GPU", "false")
+    browser_disable_web_security: bool = _env_bool("BROWSER_DISABLE_WEB_SECURITY", "false")
     
     # Request settings
-    request_timeout: int = int(os.getenv("REQUEST_TIMEOUT", "30"))
-    retry_count: int = int(os.getenv("RETRY_COUNT", "3"))
+    request_timeout: int = _env_int("REQUEST_TIMEOUT", "30")
+    retry_count: int = _env_int("RETRY_COUNT", "3")
+    
+    # API task store
+    task_store_capacity: int = _env_int("TASK_STORE_CAPACITY", "10000")
+    task_ttl: int = _env_int("TASK_TTL", "3600")
+    api_job_workers: int = _env_int("API_JOB_WORKERS", "1")
+    max_parallel_registers: int = _env_int("MAX_PARALLEL_REGISTERS", "1")
     
     def validate(self) -> list[str]:
         """Validate configuration, return list of errors."""
         errors = []
         
-        if not os.path.exists(self.clash_config):
+        if not Path(self.clash_config).is_file():
             errors.append(f"Clash config not found: {self.clash_config}")
         
-        if not os.path.exists(self.input_csv_path):
+        if not Path(self.input_csv_path).is_file():
             errors.append(f"Input CSV not found: {self.input_csv_path}")
         
         return errors
 
 
-# Global config instance
-config = Config()
+@functools.cache
+def get_config() -> Config:
+    """Get the global config, loading .env and the environment on first use."""
+    # Load .env file if exists
+    load_dotenv()
+    return Config()
+
+
+def __getattr__(name: str):
+    # Keep `from .config import config` working for existing callers
+    if name == "config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
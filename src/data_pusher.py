@@ -2,20 +2,27 @@
 Data pusher module for sending extracted cookies to remote server.
 """
 
+import gzip
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional
 
-from .utils import logger, read_json_file
+from .utils import logger, json_dumps, read_json_file
 
 
 class DataPusher:
     """Pushes account cookie data to remote server."""
     
+    # Seconds to establish a connection; timeout only bounds the response
+    CONNECT_TIMEOUT = 5
+    
     def __init__(
         self,
         target_url: str,
         timeout: int = 30,
-        retry_count: int = 3
+        retry_count: int = 3,
+        compress: bool = False
     ):
         """
         Initialize data pusher.
@@ -24,10 +31,31 @@ class DataPusher:
             target_url: URL to POST data to
             timeout: Request timeout in seconds
             retry_count: Number of retries on failure
+            compress: Send the body gzip-encoded (target must support it)
         """
         self.target_url = target_url
         self.timeout = timeout
         self.retry_count = retry_count
+        self.compress = compress
+        
+        # Persistent session so the connection is reused across retries and pushes
+        self._session = requests.Session()
+        self._session.headers["Content-Type"] = "application/json"
+        
+        # Retry with exponential backoff; retry_count is the total number of attempts.
+        # Connection failures (DNS, refused, connect timeout) are not retried:
+        # they will not recover within the backoff window.
+        retry_strategy = Retry(
+            total=max(retry_count - 1, 0),
+            connect=0,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["POST"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry_strategy)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
     
     def push(self, data: list[dict]) -> bool:
         """
@@ -36,6 +64,20 @@ class DataPusher:
         Args:
             data: List of account records to push
             
+        Returns:
+            True if successful
+        """
+        body = json_dumps(data)
+        return self._post(body, f"{len(data)} records")
+    
+    def _post(self, body: bytes, description: str) -> bool:
+        """
+        POST an encoded JSON body to the target URL.
+        
+        Args:
+            body: UTF-8 JSON document
+            description: What is being sent, for logging
+            
         Returns:
             True if successful
         """
@@ -43,39 +85,45 @@ class DataPusher:
             logger.warning("[Pusher] No target URL configured, skipping push")
             return False
         
-        for attempt in range(self.retry_count):
-            try:
-                logger.info(f"[Pusher] Sending {len(data)} records to {self.target_url}")
-                
-                response = requests.post(
-                    self.target_url,
-                    json=data,
-                    headers={"Content-Type": "application/json"},
-                    timeout=self.timeout
-                )
-                
-                if response.status_code in (200, 201, 204):
-                    logger.info(f"[Pusher] Push successful: {response.status_code}")
-                    return True
-                else:
-                    logger.warning(
-                        f"[Pusher] Push failed with status {response.status_code}: {response.text[:200]}"
-                    )
-                    
-            except requests.exceptions.Timeout:
-                logger.warning(f"[Pusher] Timeout on attempt {attempt + 1}/{self.retry_count}")
-            except requests.exceptions.RequestException as e:
-                logger.error(f"[Pusher] Request error: {e}")
+        headers = None
+        if self.compress:
+            body = gzip.compress(body)
+            headers = {"Content-Encoding": "gzip"}
+        
+        try:
+            logger.info("[Pusher] Sending %s to %s", description, self.target_url)
             
-            if attempt < self.retry_count - 1:
-                logger.info(f"[Pusher] Retrying ({attempt + 2}/{self.retry_count})...")
+            response = self._session.post(
+                self.target_url,
+                data=body,
+                headers=headers,
+                timeout=(self.CONNECT_TIMEOUT, self.timeout)
+            )
+            
+            if response.status_code in (200, 201, 204):
+                logger.info("[Pusher] Push successful: %s", response.status_code)
+                return True
+            else:
+                logger.warning("[Pusher] Push failed with status %s: %s", response.status_code, response.text[:200])
+                
+        except requests.exceptions.ConnectTimeout:
+            logger.error("[Pusher] Could not connect to %s within %ss", self.target_url, self.CONNECT_TIMEOUT)
+        except requests.exceptions.Timeout:
+            logger.warning("[Pusher] Timeout after %s attempts", self.retry_count)
+        except requests.exceptions.ConnectionError as e:
+            logger.error("[Pusher] Target unreachable: %s", e)
+        except requests.exceptions.RequestException as e:
+            logger.error("[Pusher] Request error: %s", e)
         
         logger.error("[Pusher] All push attempts failed")
         return False
     
     def push_from_file(self, json_path: str) -> bool:
         """
-        Read data from JSON file and push to target.
+        Push the account list stored in a JSON file to target.
+        
+        The file is parsed first so only a valid JSON list is ever sent,
+        re-encoded compactly.
         
         Args:
             json_path: Path to accounts.json file
@@ -83,18 +131,27 @@ class DataPusher:
         Returns:
             True if successful
         """
-        data = read_json_file(json_path)
+        try:
+            data = read_json_file(json_path)
+        except (OSError, ValueError) as e:
+            logger.error("[Pusher] Could not read %s: %s", json_path, e)
+            return False
+        
+        if not isinstance(data, list):
+            logger.error("[Pusher] %s does not hold a JSON list, not pushing it", json_path)
+            return False
+        
         if not data:
-            logger.warning(f"[Pusher] No data to push from {json_path}")
+            logger.warning("[Pusher] No data to push from %s", json_path)
             return False
         
         return self.push(data)
 
-
 def create_pusher(
     target_url: Optional[str] = None,
     timeout: int = 30,
-    retry_count: int = 3
+    retry_count: int = 3,
+    compress: bool = False
 ) -> Optional[DataPusher]:
     """
     Create a DataPusher instance if target URL is configured.
@@ -108,5 +165,6 @@ def create_pusher(
     return DataPusher(
         target_url=target_url,
         timeout=timeout,
-        retry_count=retry_count
+        retry_count=retry_count,
+        compress=compress
     )
@@ -3,22 +3,44 @@ DuckMail API client for temporary email and verification codes.
 Based on V1.1.Gemini.Business/mail_client.py implementation.
 """
 
+import asyncio
 import re
+import threading
 import time
 import random
 import string
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 
-from .utils import logger
+from .utils import logger, json_loads
+
+
+# Code with context (e.g., "验证码: 123456"), and the bare 6-digit fallback
+_CTX_RE = re.compile(
+    r'(?:验证码|code|verification|passcode|pin).*?[:：]\s*([A-Za-z0-9]{4,8})\b',
+    re.IGNORECASE | re.DOTALL
+)
+_DIGITS_RE = re.compile(r'\b\d{6}\b')
 
 
 class MailClient:
     """Client for DuckMail temporary email API."""
     
     BASE_URL = "https://api.duckmail.sbs"
+    # Mercure hub pushing inbox updates as server-sent events
+    MERCURE_URL = f"{BASE_URL}/.well-known/mercure"
+    
+    # Fallback polling: fast at first, slower once the inbox stays empty
+    POLL_INTERVAL_MIN = 1
+    POLL_INTERVAL_MAX = 5
+    POLL_BACKOFF_AFTER = 30
+    
+    # Parallel DELETEs in clear_inbox and the connection pool serving them
+    CLEAR_INBOX_WORKERS = 16
+    POOL_MAXSIZE = 32
     
     def __init__(self, proxy_url: Optional[str] = None):
         """
@@ -40,20 +62,36 @@ class MailClient:
             status_forcelist=[500, 502, 503, 504],
             allowed_methods=["HEAD", "GET", "POST", "DELETE", "PATCH"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Size the pool for concurrent inbox DELETEs plus polling and the
+        # event stream, instead of urllib3's default of 10
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_connections=4,
+            pool_maxsize=self.POOL_MAXSIZE
+        )
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
         
         # Set proxy for session
         if self.proxies:
             self.session.proxies.update(self.proxies)
-            logger.info(f"[Mail] Using proxy: {proxy_url}")
+            logger.info("[Mail] Using proxy: %s", proxy_url)
         
         # Account credentials
         self.email: Optional[str] = None
         self.password: Optional[str] = None
         self.account_id: Optional[str] = None
         self.token: Optional[str] = None
+        
+        # Set to stop a running wait_for_code early (e.g. from another thread)
+        self._cancel_wait = threading.Event()
+        # Open SSE stream, closed by cancel_wait() to unblock the reader
+        self._sse_response: Optional[requests.Response] = None
+        
+        # Inbox polling state: ETag of the last /messages response and ids
+        # of messages already inspected, so unchanged polls stay cheap
+        self._last_etag: Optional[str] = None
+        self._seen_ids: set[str] = set()
     
     def register(self, domain: Optional[str] = None) -> bool:
         """
@@ -74,11 +112,11 @@ class MailClient:
                     timeout=10
                 )
                 if resp.status_code == 200:
-                    data = resp.json()
+                    data = json_loads(resp.content)
                     if 'hydra:member' in data and len(data['hydra:member']) > 0:
                         domain = data['hydra:member'][0]['domain']
             except Exception as e:
-                logger.warning(f"[Mail] Failed to get domains, using default: {e}")
+                logger.warning("[Mail] Failed to get domains, using default: %s", e)
         
         # Generate random email and password
         rand_str = ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
@@ -86,7 +124,11 @@ class MailClient:
         self.email = f"t{timestamp}{rand_str}@{domain}"
         self.password = f"Pwd{rand_str}{timestamp}"
         
-        logger.info(f"[Mail] Registering: {self.email}")
+        logger.info("[Mail] Registering: %s", self.email)
+        
+        # A new account starts unauthenticated
+        self.token = None
+        self.session.headers.pop("Authorization", None)
         
         try:
             resp = self.session.post(
@@ -95,16 +137,42 @@ class MailClient:
                 timeout=15
             )
             if resp.status_code in [200, 201]:
-                self.account_id = resp.json().get('id')
-                logger.info(f"[Mail] Registered successfully")
+                self.account_id = json_loads(resp.content).get('id')
+                logger.info("[Mail] Registered successfully")
                 return True
             else:
-                logger.error(f"[Mail] Register failed: {resp.status_code}")
+                logger.error("[Mail] Register failed: %s", resp.status_code)
                 return False
         except Exception as e:
-            logger.error(f"[Mail] Register error: {e}")
+            logger.error("[Mail] Register error: %s", e)
             return False
     
+    def reset_and_register(self, domain: Optional[str] = None) -> bool:
+        """
+        Drop the current mailbox and register a fresh one on the same session.
+        
+        Keeps the pooled connections (and their TLS sessions) of this client,
+        so retries do not pay for new handshakes.
+        
+        Args:
+            domain: Optional domain to use
+            
+        Returns:
+            True if successful
+        """
+        self.email = None
+        self.password = None
+        self.account_id = None
+        self.token = None
+        self.session.headers.pop("Authorization", None)
+        
+        self._cancel_wait.clear()
+        self._sse_response = None
+        self._last_etag = None
+        self._seen_ids.clear()
+        
+        return self.register(domain)
+    
     def login(self) -> bool:
         """
         Login to get access token.
@@ -123,14 +191,16 @@ class MailClient:
                 timeout=15
             )
             if resp.status_code == 200:
-                self.token = resp.json().get('token')
+                self.token = json_loads(resp.content).get('token')
+                # Authenticate every later request on this session
+                self.session.headers["Authorization"] = f"Bearer {self.token}"
                 logger.info("[Mail] Login successful")
                 return True
             else:
-                logger.error(f"[Mail] Login failed: {resp.status_code}")
+                logger.error("[Mail] Login failed: %s", resp.status_code)
                 return False
         except Exception as e:
-            logger.error(f"[Mail] Login error: {e}")
+            logger.error("[Mail] Login error: %s", e)
             return False
     
     def login_existing(self, email: str, password: str) -> bool:
@@ -159,36 +229,40 @@ class MailClient:
             if not self.login():
                 return 0
         
-        headers = {"Authorization": f"Bearer {self.token}"}
         deleted_count = 0
         
         try:
             # Get all messages
             resp = self.session.get(
                 f"{self.BASE_URL}/messages",
-                headers=headers,
                 timeout=10
             )
             if resp.status_code == 200:
-                msgs = resp.json().get('hydra:member', [])
-                for msg in msgs:
-                    msg_id = msg.get('id')
-                    if msg_id:
-                        try:
-                            # Delete message
-                            self.session.delete(
+                msgs = json_loads(resp.content).get('hydra:member', [])
+                msg_ids = [msg.get('id') for msg in msgs if msg.get('id')]
+                
+                # Delete messages concurrently, each DELETE is independent
+                if msg_ids:
+                    with ThreadPoolExecutor(max_workers=min(len(msg_ids), self.CLEAR_INBOX_WORKERS)) as pool:
+                        futures = [
+                            pool.submit(
+                                self.session.delete,
                                 f"{self.BASE_URL}/messages/{msg_id}",
-                                headers=headers,
                                 timeout=10
                             )
-                            deleted_count += 1
-                        except:
-                            pass
+                            for msg_id in msg_ids
+                        ]
+                        for future in as_completed(futures):
+                            try:
+                                if future.result().status_code < 400:
+                                    deleted_count += 1
+                            except Exception:
+                                pass
                 
                 if deleted_count > 0:
-                    logger.info(f"[Mail] Cleared {deleted_count} old messages")
+                    logger.info("[Mail] Cleared %s old messages", deleted_count)
         except Exception as e:
-            logger.warning(f"[Mail] Error clearing inbox: {e}")
+            logger.warning("[Mail] Error clearing inbox: %s", e)
         
         return deleted_count
     
@@ -196,6 +270,9 @@ class MailClient:
         """
         Wait for and extract verification code from incoming emails.
         
+        Listens for inbox updates over server-sent events when the Mercure
+        hub is reachable, otherwise polls with a growing interval.
+        
         Args:
             timeout: Maximum wait time in seconds
             
@@ -206,42 +283,220 @@ class MailClient:
             if not self.login():
                 return None
         
-        logger.info(f"[Mail] Waiting for code ({timeout}s)...")
-        headers = {"Authorization": f"Bearer {self.token}"}
-        start_time = time.time()
+        logger.info("[Mail] Waiting for code (%ss)...", timeout)
+        deadline = time.time() + timeout
         
-        while (time.time() - start_time) < timeout:
+        code = self._wait_for_code_sse(deadline)
+        if code is None and not self._cancel_wait.is_set() and time.time() < deadline:
+            code = self._wait_for_code_polling(deadline)
+        
+        if code:
+            return code
+        if self._cancel_wait.is_set():
+            logger.info("[Mail] Stopped waiting for code")
+        else:
+            logger.error("[Mail] Timeout waiting for verification code")
+        return None
+    
+    def _fetch_code(self) -> Optional[str]:
+        """
+        Check the newest message for a verification code.
+        
+        Returns:
+            Verification code, or None if there is none yet
+        """
+        list_headers = {"If-None-Match": self._last_etag} if self._last_etag else None
+        
+        resp = self.session.get(
+            f"{self.BASE_URL}/messages",
+            headers=list_headers,
+            timeout=10
+        )
+        if resp.status_code == 304:
+            # Inbox unchanged since the last poll
+            return None
+        if resp.status_code != 200:
+            return None
+        etag = resp.headers.get("ETag")
+        
+        msgs = json_loads(resp.content).get('hydra:member', [])
+        if not msgs:
+            self._last_etag = etag
+            return None
+        
+        # Only the newest message matters; skip it if already inspected
+        msg_id = msgs[0]['id']
+        if msg_id in self._seen_ids:
+            self._last_etag = etag
+            return None
+        
+        # Get message detail
+        detail = self.session.get(
+            f"{self.BASE_URL}/messages/{msg_id}",
+            timeout=10
+        )
+        if detail.status_code != 200:
+            # Leave the message unseen and the ETag unset so it is retried
+            return None
+        data = json_loads(detail.content)
+        content = data.get('text') or data.get('html') or ""
+        
+        # Inspected now, later polls may skip it and send If-None-Match
+        self._seen_ids.add(msg_id)
+        self._last_etag = etag
+        
+        code = self._extract_code(content)
+        if code:
+            logger.info("[Mail] Got verification code: %s", code)
+        return code
+    
+    def _wait_for_code_sse(self, deadline: float) -> Optional[str]:
+        """
+        Wait for the code by listening to the account's Mercure topic.
+        
+        Reads use a POLL_INTERVAL_MAX timeout: when no update arrives in
+        that time the inbox is checked directly and the stream reopened, so
+        a hub that accepts the subscription but never publishes still finds
+        the code.
+        
+        Returns:
+            Verification code, or None if the stream is unavailable, ended,
+            timed out or was cancelled
+        """
+        if not self.account_id:
+            return None
+        
+        connected = False
+        while not self._cancel_wait.is_set() and time.time() < deadline:
             try:
                 resp = self.session.get(
-                    f"{self.BASE_URL}/messages",
-                    headers=headers,
-                    timeout=10
+                    self.MERCURE_URL,
+                    params={"topic": f"/accounts/{self.account_id}"},
+                    stream=True,
+                    timeout=(5, self.POLL_INTERVAL_MAX)
                 )
-                if resp.status_code == 200:
-                    msgs = resp.json().get('hydra:member', [])
-                    if msgs:
-                        msg_id = msgs[0]['id']
-                        # Get message detail
-                        detail = self.session.get(
-                            f"{self.BASE_URL}/messages/{msg_id}",
-                            headers=headers,
-                            timeout=10
-                        )
-                        data = detail.json()
-                        content = data.get('text') or data.get('html') or ""
-                        
-                        code = self._extract_code(content)
+            except Exception as e:
+                if connected:
+                    logger.warning("[Mail] Live update stream closed: %s", e)
+                else:
+                    logger.info("[Mail] Live updates unavailable, polling instead: %s", e)
+                return None
+            
+            if resp.status_code != 200:
+                resp.close()
+                logger.info("[Mail] Live updates unavailable (%s), polling instead", resp.status_code)
+                return None
+            connected = True
+            
+            self._sse_response = resp
+            try:
+                if self._cancel_wait.is_set():
+                    return None
+                
+                # The code may have arrived before the stream was (re)opened
+                code = self._fetch_code()
+                if code:
+                    return code
+                
+                for line in resp.iter_lines(decode_unicode=True):
+                    if self._cancel_wait.is_set() or time.time() >= deadline:
+                        return None
+                    if line and line.startswith("data:"):
+                        code = self._fetch_code()
                         if code:
-                            logger.info(f"[Mail] Got verification code: {code}")
                             return code
+                
+                # The hub ended the stream, poll for the rest of the wait
+                return None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                # No update within the read timeout (or a cancel-close):
+                # loop to check the inbox and reopen the stream
+                continue
             except Exception as e:
-                logger.warning(f"[Mail] Error checking messages: {e}")
+                logger.warning("[Mail] Live update stream closed: %s", e)
+                return None
+            finally:
+                self._sse_response = None
+                resp.close()
+        
+        return None
+    
+    def _wait_for_code_polling(self, deadline: float) -> Optional[str]:
+        """
+        Wait for the code by polling the inbox.
+        
+        Polls every POLL_INTERVAL_MIN seconds, then every POLL_INTERVAL_MAX
+        seconds once nothing has arrived for POLL_BACKOFF_AFTER seconds.
+        
+        Returns:
+            Verification code, or None if timeout or cancelled
+        """
+        start_time = time.time()
+        
+        while time.time() < deadline:
+            if self._cancel_wait.is_set():
+                return None
             
-            time.sleep(3)
+            try:
+                code = self._fetch_code()
+                if code:
+                    return code
+            except Exception as e:
+                logger.warning("[Mail] Error checking messages: %s", e)
+            
+            waited = time.time() - start_time
+            interval = self.POLL_INTERVAL_MIN if waited < self.POLL_BACKOFF_AFTER else self.POLL_INTERVAL_MAX
+            self._cancel_wait.wait(min(interval, max(deadline - time.time(), 0)))
         
-        logger.error("[Mail] Timeout waiting for verification code")
         return None
     
+    def cancel_wait(self) -> None:
+        """Stop a wait_for_code call running in another thread."""
+        self._cancel_wait.set()
+        # Unblock a reader waiting on the event stream
+        resp = self._sse_response
+        if resp is not None:
+            try:
+                resp.close()
+            except Exception:
+                pass
+    
+    def close(self) -> None:
+        """Stop any pending wait and release pooled connections."""
+        self.cancel_wait()
+        self.session.close()
+    
+    def __enter__(self) -> "MailClient":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+    
+    async def __aenter__(self) -> "MailClient":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await asyncio.to_thread(self.close)
+    
+    async def wait_for_code_async(self, timeout: int = 300) -> Optional[str]:
+        """
+        Await wait_for_code without blocking the event loop.
+        
+        The blocking wait (SSE stream or polling on the pooled session) runs
+        in a worker thread; cancelling the awaiting task stops it promptly.
+        
+        Args:
+            timeout: Maximum wait time in seconds
+            
+        Returns:
+            Verification code, or None if timeout
+        """
+        try:
+            return await asyncio.to_thread(self.wait_for_code, timeout)
+        except asyncio.CancelledError:
+            self.cancel_wait()
+            raise
+    
     def _extract_code(self, text: str) -> Optional[str]:
         """
         Extract verification code from email content.
@@ -252,16 +507,15 @@ class MailClient:
         Returns:
             Extracted code or None
         """
-        # Pattern for code with context (e.g., "验证码: 123456")
-        pattern_context = r'(?:验证码|code|verification|passcode|pin).*?[:：]\s*([A-Za-z0-9]{4,8})\b'
-        match = re.search(pattern_context, text, re.IGNORECASE | re.DOTALL)
+        # Code with context (e.g., "验证码: 123456")
+        match = _CTX_RE.search(text)
         if match:
             return match.group(1)
         
         # Fallback: find 6-digit number
-        digits = re.findall(r'\b\d{6}\b', text)
-        if digits:
-            return digits[0]
+        match = _DIGITS_RE.search(text)
+        if match:
+            return match.group(0)
         
         return None
     
@@ -270,16 +524,14 @@ class MailClient:
         if not self.account_id or not self.token:
             return
         
-        headers = {"Authorization": f"Bearer {self.token}"}
         try:
             self.session.delete(
                 f"{self.BASE_URL}/accounts/{self.account_id}",
-                headers=headers,
                 timeout=10
             )
             logger.info("[Mail] Account deleted")
         except Exception as e:
-            logger.warning(f"[Mail] Failed to delete account: {e}")
+            logger.warning("[Mail] Failed to delete account: %s", e)
 
 
 # Convenience function
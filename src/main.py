@@ -12,20 +12,25 @@ Supports two modes:
 
 import asyncio
 import argparse
+import contextlib
 import sys
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from .config import config
-from .utils import logger, read_csv_accounts, update_accounts_json, read_json_file, append_to_csv
-from .clash_manager import ClashManager, get_manager
-from .mail_client import MailClient, get_mail_client
-from .browser_controller import BrowserController
-from .data_pusher import create_pusher
+from .config import get_config
+from .utils import logger, read_csv_accounts, update_accounts_json, AccountStore
+
+# Heavy modules (Playwright, Clash process control, HTTP clients) are imported
+# where they are first used, so --api and --help do not pay for them here.
+if TYPE_CHECKING:
+    from .clash_manager import ClashManager
+    from .browser_controller import BrowserController, SharedBrowser
 
 
 async def register_new_account(
-    clash_manager: ClashManager,
-    headless: bool = True
+    clash_manager: "ClashManager",
+    headless: bool = True,
+    proxy_node: str = None,
+    shared_browser: Optional["SharedBrowser"] = None
 ) -> Optional[dict]:
     """
     Register a new Gemini Business account using DuckMail.
@@ -33,98 +38,105 @@ async def register_new_account(
     Args:
         clash_manager: ClashManager instance
         headless: Run browser in headless mode
+        proxy_node: Specific proxy node name to use (if None, find healthy node)
+        shared_browser: Open a context on this browser instead of launching one
         
     Returns:
         Account data dict if successful, None otherwise
     """
+    from .mail_client import MailClient
+    from .browser_controller import BrowserController
+    
     logger.info("="*50)
     logger.info("Registering new Gemini Business account")
     logger.info("="*50)
     
-    # Find healthy proxy node
-    node = clash_manager.find_healthy_node()
-    if not node:
-        logger.error("No healthy proxy node available")
-        return None
+    # Use specified node or find healthy one
+    if proxy_node:
+        if not await asyncio.to_thread(clash_manager.switch_node, proxy_node):
+            logger.error("Failed to switch to specified node: %s", proxy_node)
+            return None
+        node = proxy_node
+    else:
+        node = await asyncio.to_thread(clash_manager.get_healthy_node)
+        if not node:
+            logger.error("No healthy proxy node available")
+            return None
     
-    logger.info(f"Using proxy node: {node}")
+    logger.info("Using proxy node: %s", node)
     
     max_retries = 3
     
-    for attempt in range(max_retries):
-        if attempt > 0:
-            logger.info(f"[Retry] Attempt {attempt + 1}/{max_retries} - Registering new email...")
-        
-        # Create new mail client for each attempt
-        mail_client = MailClient(proxy_url=clash_manager.get_proxy_url())
-        
-        # Register new email
-        if not mail_client.register():
-            logger.error("Failed to register temporary email")
-            continue
-        
-        email = mail_client.email
-        password = mail_client.password
-        logger.info(f"Using email: {email}")
-        
-        # Create browser controller
-        browser = BrowserController(
-            proxy_url=clash_manager.get_proxy_url(),
-            headless=headless
-        )
-        
-        try:
-            # Start browser
-            await browser.start()
-            
-            # Perform login (enter email)
-            if not await browser.login(email, password):
-                logger.error("Failed to submit email to Gemini Business")
-                await browser.stop()
-                continue
-            
-            # Wait for verification code from DuckMail
-            code = mail_client.wait_for_code(timeout=30)
-            
-            if not code:
-                logger.warning(f"[Mail] Verification code timeout (attempt {attempt + 1}/{max_retries})")
-                await browser.stop()
-                continue
-            
-            logger.info(f"Got verification code: {code}")
-            
-            # Enter verification code
-            if not await browser.enter_verification_code(code):
-                logger.error("Failed to verify code")
-                await browser.stop()
-                continue
-            
-            # Wait for login to complete
-            if not await browser.wait_for_login_complete(timeout=60):
-                logger.error("Login did not complete")
-                await browser.stop()
-                continue
-            
-            # Extract cookies
-            cookie_data = await browser.extract_cookies()
-            
-            if not cookie_data.get("secure_c_ses"):
-                logger.error("Failed to extract cookies")
-                await browser.stop()
-                continue
-            
-            # Add account info
-            cookie_data["email"] = email
-            cookie_data["password"] = password
-            
-            logger.info(f"✅ Successfully registered: {email}")
-            await browser.stop()
-            return cookie_data
-            
-        except Exception as e:
-            logger.error(f"Error during registration: {e}")
-            await browser.stop()
-            continue
+    try:
+        # One mail client (and HTTP session) and one browser serve every
+        # attempt; the browser session is wiped in between
+        async with MailClient(proxy_url=clash_manager.get_proxy_url()) as mail_client, \
+                BrowserController(
+                    proxy_url=clash_manager.get_proxy_url(),
+                    headless=headless,
+                    shared_browser=shared_browser
+                ) as browser:
+            for attempt in range(max_retries):
+                if attempt > 0:
+                    logger.info("[Retry] Attempt %s/%s - Registering new email...", attempt + 1, max_retries)
+                    await browser.reset_or_restart()
+                
+                # Register a fresh mailbox for this attempt
+                if not await asyncio.to_thread(mail_client.reset_and_register):
+                    logger.error("Failed to register temporary email")
+                    continue
+                
+                email = mail_client.email
+                password = mail_client.password
+                logger.info("Using email: %s", email)
+                
+                try:
+                    # Perform login (enter email)
+                    if not await browser.login(email, password):
+                        logger.error("Failed to submit email to Gemini Business")
+                        continue
+                    
+                    # Wait for verification code from DuckMail
+                    code = await mail_client.wait_for_code_async(timeout=30)
+                    
+                    if not code:
+                        logger.warning("[Mail] Verification code timeout (attempt %s/%s)", attempt + 1, max_retries)
+                        continue
+                    
+                    logger.info("Got verification code: %s", code)
+                    
+                    # Enter verification code
+                    if not await browser.enter_verification_code(code):
+                        logger.error("Failed to verify code")
+                        continue
+                    
+                    # Wait for login to complete
+                    if not await browser.wait_for_login_complete(timeout=60):
+                        logger.error("Login did not complete")
+                        continue
+                    
+                    # Extract cookies
+                    cookie_data = await browser.extract_cookies()
+                    
+                    if not cookie_data.get("secure_c_ses"):
+                        logger.error("Failed to extract cookies")
+                        continue
+                    
+                    # Add account info
+                    cookie_data["email"] = email
+                    cookie_data["password"] = password
+                    
+                    logger.info("✅ Successfully registered: %s", email)
+                    clash_manager.mark_node_ok(node)
+                    return cookie_data
+                
+                except Exception as e:
+                    logger.error("Error during registration: %s", e)
+                    continue
+    
+    except Exception as e:
+        logger.error("Error during registration: %s", e)
+        return None
     
     logger.error("Failed to register account after all retries")
     return None
@@ -132,9 +144,12 @@ async def register_new_account(
 
 async def process_existing_account(
     account: dict,
-    clash_manager: ClashManager,
+    clash_manager: "ClashManager",
     headless: bool = True,
-    proxy_node: str = None
+    proxy_node: str = None,
+    store: Optional[AccountStore] = None,
+    shared_browser: Optional["SharedBrowser"] = None,
+    browser: Optional["BrowserController"] = None
 ) -> bool:
     """
     Process an existing DuckMail account: login to Gemini Business and extract cookies.
@@ -145,10 +160,18 @@ async def process_existing_account(
         clash_manager: ClashManager instance
         headless: Run browser in headless mode
         proxy_node: Specific proxy node name to use (if None, find healthy node)
+        store: AccountStore to save into (if None, update accounts.json directly)
+        shared_browser: Open a context on this browser instead of launching one
+        browser: Started controller to use (caller resets and stops it),
+            instead of creating one for this account
         
     Returns:
         True if successful
     """
+    from .mail_client import MailClient
+    from .browser_controller import BrowserController
+    
+    config = get_config()
     email = account.get("email", "")
     password = account.get("password", "")
     
@@ -157,89 +180,91 @@ async def process_existing_account(
         return False
     
     logger.info("="*50)
-    logger.info(f"Processing account: {email}")
+    logger.info("Processing account: %s", email)
     logger.info("="*50)
     
     # Use specified node or find healthy one
     if proxy_node:
         # Switch to specified node
-        if clash_manager.switch_node(proxy_node):
+        if await asyncio.to_thread(clash_manager.switch_node, proxy_node):
             node = proxy_node
-            logger.info(f"Using specified proxy node: {node}")
+            logger.info("Using specified proxy node: %s", node)
         else:
-            logger.error(f"Failed to switch to specified node: {proxy_node}")
+            logger.error("Failed to switch to specified node: %s", proxy_node)
             return False
     else:
         # Find healthy proxy node
-        node = clash_manager.find_healthy_node()
+        node = await asyncio.to_thread(clash_manager.get_healthy_node)
         if not node:
-            logger.error(f"No healthy proxy node available for {email}")
+            logger.error("No healthy proxy node available for %s", email)
             return False
-        logger.info(f"Using proxy node: {node}")
+        logger.info("Using proxy node: %s", node)
     
     # Create mail client with proxy - set credentials for this account
-    mail_client = MailClient(proxy_url=clash_manager.get_proxy_url())
-    mail_client.email = email
-    mail_client.password = password
-    
-    # Create browser controller
-    browser = BrowserController(
-        proxy_url=clash_manager.get_proxy_url(),
-        headless=headless
-    )
-    
-    try:
-        # Start browser
-        await browser.start()
-        
-        # Clear old messages before login to avoid old verification codes
-        mail_client.clear_inbox()
-        
-        # Perform login (enter email on Gemini Business)
-        if not await browser.login(email, password):
-            logger.error(f"Failed to start login for {email}")
-            return False
-        
-        # Get verification code from DuckMail API
-        code = mail_client.wait_for_code(timeout=30)
-        if not code:
-            logger.error(f"Failed to get verification code for {email}")
-            return False
-        
-        logger.info(f"Got verification code: {code}")
-        
-        # Enter verification code in browser
-        if not await browser.enter_verification_code(code):
-            logger.error(f"Failed to verify code for {email}")
-            return False
-        
-        # Wait for login to complete
-        if not await browser.wait_for_login_complete(timeout=60):
-            logger.error(f"Login did not complete for {email}")
-            return False
+    async with MailClient(proxy_url=clash_manager.get_proxy_url()) as mail_client:
+        mail_client.email = email
+        mail_client.password = password
         
-        # Extract cookies
-        cookie_data = await browser.extract_cookies()
+        if browser is not None:
+            browser_cm = contextlib.nullcontext(browser)
+        else:
+            browser_cm = BrowserController(
+                proxy_url=clash_manager.get_proxy_url(),
+                headless=headless,
+                shared_browser=shared_browser
+            )
         
-        if not cookie_data.get("secure_c_ses"):
-            logger.error(f"Failed to extract cookies for {email}")
+        try:
+            async with browser_cm as browser:
+                # Clear old messages before login to avoid old verification codes
+                await asyncio.to_thread(mail_client.clear_inbox)
+                
+                # Perform login (enter email on Gemini Business)
+                if not await browser.login(email, password):
+                    logger.error("Failed to start login for %s", email)
+                    return False
+                
+                # Get verification code from DuckMail API
+                code = await mail_client.wait_for_code_async(timeout=30)
+                if not code:
+                    logger.error("Failed to get verification code for %s", email)
+                    return False
+                
+                logger.info("Got verification code: %s", code)
+                
+                # Enter verification code in browser
+                if not await browser.enter_verification_code(code):
+                    logger.error("Failed to verify code for %s", email)
+                    return False
+                
+                # Wait for login to complete
+                if not await browser.wait_for_login_complete(timeout=60):
+                    logger.error("Login did not complete for %s", email)
+                    return False
+                
+                # Extract cookies
+                cookie_data = await browser.extract_cookies()
+                
+                if not cookie_data.get("secure_c_ses"):
+                    logger.error("Failed to extract cookies for %s", email)
+                    return False
+                
+                # Add account info
+                cookie_data["email"] = email
+                
+                # Save to accounts.json
+                if store is not None:
+                    await store.upsert(email, cookie_data)
+                else:
+                    update_accounts_json(config.output_json_path, email, cookie_data)
+                
+                logger.info("✅ Successfully processed: %s", email)
+                clash_manager.mark_node_ok(node)
+                return True
+            
+        except Exception as e:
+            logger.error("Error processing %s: %s", email, e)
             return False
-        
-        # Add account info
-        cookie_data["email"] = email
-        
-        # Save to accounts.json
-        update_accounts_json(config.output_json_path, email, cookie_data)
-        
-        logger.info(f"✅ Successfully processed: {email}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error processing {email}: {e}")
-        return False
-        
-    finally:
-        await browser.stop()
 
 
 async def main_async(args: argparse.Namespace) -> int:
@@ -252,6 +277,8 @@ async def main_async(args: argparse.Namespace) -> int:
     Returns:
         Exit code
     """
+    config = get_config()
+    
     # Validate config
     errors = config.validate()
     if errors:
@@ -259,103 +286,167 @@ async def main_async(args: argparse.Namespace) -> int:
             logger.error(error)
         return 1
     
+    from .clash_manager import get_manager
+    from .browser_controller import get_shared_browser, shutdown_shared
+    
     # Initialize Clash manager
     logger.info("Starting Clash proxy manager...")
     clash_manager = get_manager(
         executable=config.clash_executable,
         config=config.clash_config,
         port=config.clash_port,
-        api_port=config.clash_api_port
+        api_port=config.clash_api_port,
+        latency_probe_concurrency=config.clash_probe_concurrency,
+        latency_probe_jitter_ms=config.clash_probe_jitter_ms
     )
-    clash_manager.start()
+    await asyncio.to_thread(clash_manager.start)
     
     success_count = 0
     fail_count = 0
     
+    # Accounts processed at once
+    concurrency = max(args.concurrency, 1)
+    sem = asyncio.Semaphore(concurrency)
+    
+    # accounts.json and the CSV max ID are loaded once for the whole run
+    store = AccountStore(config.output_json_path, config.input_csv_path)
+    
+    # Launch Chromium once and give each account its own context. Headless
+    # runs never load the extension, so they lose nothing by sharing.
+    shared_browser = None
+    if config.browser_headless or config.browser_shared:
+        shared_browser = get_shared_browser(config.browser_headless)
+    
     try:
+        # Clash routes all workers through one selected node, so concurrent
+        # workers share a node picked up front instead of each switching it
+        proxy_node = args.proxy_node
+        if concurrency > 1 and not proxy_node:
+            proxy_node = await asyncio.to_thread(clash_manager.get_healthy_node)
+            if not proxy_node:
+                logger.error("No healthy proxy node available")
+                return 1
+            logger.info("Running %s workers on proxy node: %s", concurrency, proxy_node)
+        
         if args.register:
             # Register new accounts mode
-            for i in range(args.count):
-                logger.info(f"\n--- Account {i+1}/{args.count} ---\n")
-                result = await register_new_account(
-                    clash_manager,
-                    headless=config.browser_headless
-                )
-                if result:
-                    # Save to accounts.json
-                    update_accounts_json(config.output_json_path, result["email"], result)
-                    # Also save to result.csv for future refresh
-                    append_to_csv(config.input_csv_path, result["email"], result.get("password", ""))
-                    success_count += 1
-                else:
-                    fail_count += 1
-                
-                # Cooldown between accounts
-                if i < args.count - 1:
-                    logger.info("Cooldown 3s...")
-                    await asyncio.sleep(3)
+            consecutive_fails = 0
+            
+            async def register_one(i: int) -> bool:
+                nonlocal consecutive_fails
+                async with sem:
+                    logger.info("\n--- Account %s/%s ---\n", i+1, args.count)
+                    result = await register_new_account(
+                        clash_manager,
+                        headless=config.browser_headless,
+                        proxy_node=proxy_node,
+                        shared_browser=shared_browser
+                    )
+                    if result:
+                        # Save to accounts.json
+                        await store.upsert(result["email"], result)
+                        # Also save to result.csv for future refresh
+                        await store.append_csv_row(result["email"], result.get("password", ""))
+                        consecutive_fails = 0
+                    else:
+                        # Back off only after failures, growing with each one in a row
+                        consecutive_fails += 1
+                        if i < args.count - 1:
+                            delay = min(10, 1 << consecutive_fails)
+                            logger.info("Cooldown %ss after failure...", delay)
+                            await asyncio.sleep(delay)
+                    
+                    return bool(result)
+            
+            results = await asyncio.gather(
+                *(register_one(i) for i in range(args.count)),
+                return_exceptions=True
+            )
         else:
             accounts = read_csv_accounts(config.input_csv_path)
             if not accounts:
                 logger.error("No accounts to process")
                 return 1
             
-            logger.info(f"Loaded {len(accounts)} accounts from {config.input_csv_path}")
+            logger.info("Loaded %s accounts from %s", len(accounts), config.input_csv_path)
             
-            # Load existing accounts from accounts.json to skip already processed
-            existing_accounts = set()
-            try:
-                existing_data = read_json_file(config.output_json_path)
-                if isinstance(existing_data, list):
-                    for acc in existing_data:
-                        if acc.get("email"):
-                            existing_accounts.add(acc["email"])
-                elif isinstance(existing_data, dict):
-                    for email in existing_data.keys():
-                        existing_accounts.add(email)
-                if existing_accounts:
-                    logger.info(f"Found {len(existing_accounts)} already processed accounts in accounts.json")
-            except:
-                pass
+            # Accounts already in accounts.json are skipped
+            existing_accounts = store.emails
+            if existing_accounts:
+                logger.info("Found %s already processed accounts in accounts.json", len(existing_accounts))
             
-            for account in accounts:
-                email = account.get("email", "")
-                
-                # Skip already processed accounts
-                if email in existing_accounts:
-                    logger.info(f"Skipping already processed: {email}")
-                    continue
-                
-                try:
-                    if await process_existing_account(
-                        account,
-                        clash_manager,
-                        headless=config.browser_headless,
-                        proxy_node=args.proxy_node
-                    ):
-                        success_count += 1
-                    else:
-                        fail_count += 1
-                except Exception as e:
-                    logger.error(f"Unexpected error: {e}")
-                    fail_count += 1
+            # Skip already processed accounts in one pass
+            pending = [a for a in accounts if a.get("email") and a["email"] not in existing_accounts]
+            skipped = len(accounts) - len(pending)
+            if skipped:
+                logger.info("Skipping %s already processed or email-less accounts", skipped)
+            
+            # Each worker keeps one browser for all the accounts it takes,
+            # wiping the session in between instead of relaunching
+            from .browser_controller import BrowserController
+            
+            remaining = iter(pending)
+            results = []
+            
+            async def refresh_worker() -> None:
+                async with BrowserController(
+                    proxy_url=clash_manager.get_proxy_url(),
+                    headless=config.browser_headless,
+                    shared_browser=shared_browser
+                ) as browser:
+                    for n, account in enumerate(remaining):
+                        if n > 0:
+                            await browser.reset_or_restart()
+                        results.append(await process_existing_account(
+                            account,
+                            clash_manager,
+                            proxy_node=proxy_node,
+                            store=store,
+                            browser=browser
+                        ))
+            
+            worker_errors = await asyncio.gather(
+                *(refresh_worker() for _ in range(min(concurrency, len(pending)))),
+                return_exceptions=True
+            )
+            for error in worker_errors:
+                if isinstance(error, Exception):
+                    logger.error("Refresh worker stopped: %s", error)
+            # Accounts taken or left over by a worker whose browser failed
+            results.extend(False for _ in range(len(pending) - len(results)))
+        
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("Unexpected error: %s", result)
+                fail_count += 1
+            elif result:
+                success_count += 1
+            else:
+                fail_count += 1
     
     finally:
+        # Write pending accounts before anything reads accounts.json
+        await store.close()
+        if shared_browser is not None:
+            await shutdown_shared()
         # Stop Clash
-        clash_manager.stop()
+        await asyncio.to_thread(clash_manager.stop)
     
     # Summary
     logger.info("="*50)
     logger.info("Processing complete!")
-    logger.info(f"Success: {success_count}, Failed: {fail_count}")
+    logger.info("Success: %s, Failed: %s", success_count, fail_count)
     logger.info("="*50)
     
     # Push results if configured
     if config.post_target_url:
+        from .data_pusher import create_pusher
+        
         pusher = create_pusher(
             target_url=config.post_target_url,
             timeout=config.request_timeout,
-            retry_count=config.retry_count
+            retry_count=config.retry_count,
+            compress=config.post_gzip
         )
         if pusher:
             pusher.push_from_file(config.output_json_path)
@@ -405,6 +496,12 @@ def main() -> int:
         default=1,
         help="Number of accounts to register (with --register)"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of accounts to process at once (default: 1)"
+    )
     parser.add_argument(
         "--proxy-node",
         type=str,
@@ -431,7 +528,8 @@ def main() -> int:
         run_server(port=args.api_port)
         return 0
     
-    # Override config with command line args
+    # Override config with command line args (the shared instance is mutable)
+    config = get_config()
     if args.config:
         config.clash_config = args.config
     if args.input:
@@ -2,20 +2,30 @@
 Utility functions for file operations and logging.
 """
 
+import asyncio
 import csv
 import json
 import logging
-from datetime import datetime
+import os
+import tempfile
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any
 
+# orjson is much faster than the stdlib json; fall back when it is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def setup_logging(level: int = logging.INFO) -> logging.Logger:
     """Setup and return logger instance."""
     logging.basicConfig(
         level=level,
         format="%(asctime)s [%(levelname)s] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
+        datefmt="%Y-%m-%d %H:%M:%S",
+        style="%"
     )
     return logging.getLogger(__name__)
 
@@ -23,6 +33,27 @@ def setup_logging(level: int = logging.INFO) -> logging.Logger:
 logger = setup_logging()
 
 
+def json_loads(data: bytes | str) -> Any:
+    """Parse a JSON document (e.g. an HTTP response body)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_dumps_indented(obj: Any) -> bytes:
+    """Serialize to UTF-8 JSON bytes indented by two spaces, as in accounts.json."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+
 def read_csv_accounts(csv_path: str) -> list[dict]:
     """
     Read accounts from CSV file.
@@ -32,20 +63,36 @@ def read_csv_accounts(csv_path: str) -> list[dict]:
     """
     accounts = []
     
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        id_col, email_col, password_col, date_col = (
+            _column_index(header, name) for name in ("ID", "Account", "Password", "Date")
+        )
         for row in reader:
+            if not row:
+                continue
             accounts.append({
-                "id": row.get("ID", ""),
-                "email": row.get("Account", ""),
-                "password": row.get("Password", ""),
-                "date": row.get("Date", "")
+                "id": _cell(row, id_col),
+                "email": _cell(row, email_col),
+                "password": _cell(row, password_col),
+                "date": _cell(row, date_col)
             })
     
-    logger.info(f"Loaded {len(accounts)} accounts from {csv_path}")
+    logger.info("Loaded %s accounts from %s", len(accounts), csv_path)
     return accounts
 
 
+def _column_index(header: list[str], name: str) -> int | None:
+    """Position of a named column in the CSV header, None if absent."""
+    return header.index(name) if name in header else None
+
+
+def _cell(row: list[str], col: int | None) -> str:
+    """Value of a column in a csv.reader row, "" if missing."""
+    return row[col] if col is not None and col < len(row) else ""
+
+
 def append_to_csv(csv_path: str, email: str, password: str) -> bool:
     """
     Append a new account to the CSV file.
@@ -55,6 +102,20 @@ def append_to_csv(csv_path: str, email: str, password: str) -> bool:
         email: Account email
         password: Account password
         
+    Returns:
+        True if successful
+    """
+    return append_many_to_csv(csv_path, [(email, password)])
+
+
+def append_many_to_csv(csv_path: str, accounts: list[tuple[str, str]]) -> bool:
+    """
+    Append several accounts to the CSV file with a single ID scan.
+    
+    Args:
+        csv_path: Path to result.csv
+        accounts: List of (email, password) tuples
+        
     Returns:
         True if successful
     """
@@ -64,31 +125,27 @@ def append_to_csv(csv_path: str, email: str, password: str) -> bool:
         next_id = 1
         
         if path.exists():
-            with open(csv_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                rows = list(reader)
-                if rows:
-                    # Get max ID + 1, handle empty or invalid IDs
-                    valid_ids = [int(row.get("ID", 0)) for row in rows if row.get("ID", "").isdigit()]
-                    max_id = max(valid_ids) if valid_ids else 0
-                    next_id = max_id + 1
+            # Get max ID + 1, handle empty or invalid IDs
+            next_id = _max_csv_id(csv_path) + 1
         else:
             # Create new file with header
             with open(csv_path, "w", encoding="utf-8", newline="") as f:
                 writer = csv.writer(f)
                 writer.writerow(["ID", "Account", "Password", "Date"])
         
-        # Append new account
+        # Append new accounts
         today = datetime.now().strftime("%Y-%m-%d")
         with open(csv_path, "a", encoding="utf-8", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow([next_id, email, password, today])
+            for offset, (email, password) in enumerate(accounts):
+                writer.writerow([next_id + offset, email, password, today])
         
-        logger.info(f"Appended account to CSV: {email}")
+        for email, _ in accounts:
+            logger.info("Appended account to CSV: %s", email)
         return True
         
     except Exception as e:
-        logger.error(f"Failed to append to CSV: {e}")
+        logger.error("Failed to append to CSV: %s", e)
         return False
 
 
@@ -98,16 +155,44 @@ def read_json_file(json_path: str) -> list[dict]:
     if not path.exists():
         return []
     
-    with open(json_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return json_loads(path.read_bytes())
 
 
 def write_json_file(json_path: str, data: list[dict]) -> None:
-    """Write data to JSON file."""
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    """
+    Write data to JSON file atomically.
+    
+    The content goes to a temporary file in the same directory, is synced
+    to disk, and then replaces the target, so a crash mid-write never
+    leaves a truncated file behind.
+    """
+    content = _json_dumps_indented(data)
     
-    logger.info(f"Saved {len(data)} records to {json_path}")
+    target_dir = os.path.dirname(os.path.abspath(json_path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=target_dir, prefix=f".{os.path.basename(json_path)}.", suffix=".tmp"
+    )
+    try:
+        # mkstemp creates the file 0600; keep the mode the target already had
+        try:
+            os.chmod(tmp_path, os.stat(json_path).st_mode & 0o777)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, json_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    
+    logger.info("Saved %s records to %s", len(data), json_path)
 
 
 def update_accounts_json(
@@ -123,36 +208,238 @@ def update_accounts_json(
         email: Account email
         cookie_data: Dict containing secure_c_ses, csesidx, config_id, host_c_oses
     """
-    accounts = read_json_file(json_path)
+    update_accounts_json_many(json_path, [(email, cookie_data)])
+
+
+def update_accounts_json_many(
+    json_path: str,
+    updates: list[tuple[str, dict]]
+) -> None:
+    """
+    Apply several account updates with one read and one write of the file.
+    
+    Args:
+        json_path: Path to accounts.json
+        updates: List of (email, cookie_data) tuples
+    """
+    accounts_by_email, unkeyed = _index_accounts(read_json_file(json_path))
+    
+    for email, cookie_data in updates:
+        _upsert_account(accounts_by_email, email, cookie_data)
+    
+    write_json_file(json_path, [*accounts_by_email.values(), *unkeyed])
+
+
+def _index_accounts(data: list[dict] | dict) -> tuple[dict[str, dict], list]:
+    """
+    Key accounts.json records by email (also accepts the older email-keyed layout).
+    
+    Records without an email and later duplicates of an email cannot be
+    keyed; they are returned separately so they can be written back as-is.
+    
+    Returns:
+        Tuple of (records by email, unkeyed records)
+    """
+    if isinstance(data, dict):
+        return {
+            email: {**record, "email": email}
+            for email, record in data.items() if isinstance(record, dict)
+        }, []
     
-    # Find existing account by email
-    existing_idx = None
-    for idx, account in enumerate(accounts):
-        if account.get("email") == email:
-            existing_idx = idx
-            break
+    accounts_by_email: dict[str, dict] = {}
+    unkeyed: list = []
+    for record in data:
+        email = record.get("email") if isinstance(record, dict) else None
+        # The first record for an email is the one updates apply to
+        if email and email not in accounts_by_email:
+            accounts_by_email[email] = record
+        else:
+            unkeyed.append(record)
     
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if unkeyed:
+        logger.warning(
+            "%s accounts.json records have no email or a duplicate email; keeping them unchanged",
+            len(unkeyed)
+        )
+    return accounts_by_email, unkeyed
+
+
+def _upsert_account(accounts_by_email: dict[str, dict], email: str, cookie_data: dict) -> None:
+    """Update or add the record for email in place."""
+    existing = accounts_by_email.get(email)
+    accounts_by_email[email] = _account_record(len(accounts_by_email), existing, email, cookie_data)
+    
+    if existing is not None:
+        logger.info("Updated account: %s", email)
+    else:
+        logger.info("Added new account: %s", email)
+
+
+def _account_record(
+    count: int,
+    existing: dict | None,
+    email: str,
+    cookie_data: dict
+) -> dict:
+    """Build the accounts.json record for email, keeping id/created_at of an existing entry."""
+    now_dt = datetime.now()
+    now = now_dt.strftime("%Y-%m-%d %H:%M:%S")
     # Default expiry is 7 days from now
-    expires = datetime.now().replace(day=datetime.now().day + 7).strftime("%Y-%m-%d %H:%M:%S")
+    expires = (now_dt + timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
     
-    record = {
-        "id": f"account_{len(accounts) + 1}" if existing_idx is None else accounts[existing_idx].get("id"),
+    return {
+        "id": f"account_{count + 1}" if existing is None else existing.get("id"),
         "email": email,
         "secure_c_ses": cookie_data.get("secure_c_ses", ""),
         "csesidx": cookie_data.get("csesidx", ""),
         "config_id": cookie_data.get("config_id", ""),
         "host_c_oses": cookie_data.get("host_c_oses", ""),
         "expires_at": expires,
-        "created_at": now if existing_idx is None else accounts[existing_idx].get("created_at", now),
+        "created_at": now if existing is None else existing.get("created_at", now),
         "updated_at": now
     }
+
+
+def _max_csv_id(csv_path: str) -> int:
+    """Return the highest numeric ID in the CSV file, 0 if none."""
+    max_id = 0
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        id_col = _column_index(next(reader, []), "ID")
+        if id_col is None:
+            return 0
+        for row in reader:
+            value = _cell(row, id_col)
+            if value.isdigit():
+                row_id = int(value)
+                if row_id > max_id:
+                    max_id = row_id
+    return max_id
+
+
+class AccountStore:
+    """
+    In-memory view of accounts.json and result.csv for one CLI run.
     
-    if existing_idx is not None:
-        accounts[existing_idx] = record
-        logger.info(f"Updated account: {email}")
-    else:
-        accounts.append(record)
-        logger.info(f"Added new account: {email}")
+    Both files are read once. Upserts only touch the in-memory list and are
+    written out every `flush_every` changes and on close(); CSV rows are
+    appended with a cached next ID through one file handle kept open until
+    close().
+    """
+    
+    def __init__(self, json_path: str, csv_path: str, flush_every: int = 10):
+        """
+        Load accounts.json and the CSV max ID.
+        
+        Args:
+            json_path: Path to accounts.json
+            csv_path: Path to result.csv
+            flush_every: Write accounts.json after this many upserts
+        """
+        self.json_path = json_path
+        self.csv_path = csv_path
+        self.flush_every = max(flush_every, 1)
+        
+        # An OSError propagates: starting empty would let the first flush
+        # overwrite accounts that are still on disk
+        try:
+            data = read_json_file(json_path)
+        except json.JSONDecodeError as e:
+            logger.warning("%s is not valid JSON: %s", json_path, e)
+            data = None
+        
+        if not isinstance(data, (list, dict)):
+            if data is not None:
+                logger.warning("%s holds %s instead of a list", json_path, type(data).__name__)
+            self._backup_damaged(json_path)
+            data = []
+        self._accounts, self._unkeyed = _index_accounts(data)
+        
+        self._next_id = (_max_csv_id(csv_path) if Path(csv_path).exists() else 0) + 1
+        self._dirty = 0
+        self._lock = asyncio.Lock()
+        
+        # Opened on the first appended row
+        self._csv_file = None
+        self._csv_writer = None
+    
+    @property
+    def emails(self):
+        """Emails that already have a record in accounts.json."""
+        return self._accounts.keys()
+    
+    async def upsert(self, email: str, cookie_data: dict) -> None:
+        """
+        Update or add account cookie data, flushing every `flush_every` changes.
+        
+        Args:
+            email: Account email
+            cookie_data: Dict containing secure_c_ses, csesidx, config_id, host_c_oses
+        """
+        async with self._lock:
+            _upsert_account(self._accounts, email, cookie_data)
+            
+            self._dirty += 1
+            if self._dirty >= self.flush_every:
+                self._flush()
+    
+    async def append_csv_row(self, email: str, password: str) -> bool:
+        """
+        Append a new account to the CSV file using the cached next ID.
+        
+        Args:
+            email: Account email
+            password: Account password
+            
+        Returns:
+            True if successful
+        """
+        async with self._lock:
+            try:
+                if self._csv_writer is None:
+                    is_new = not Path(self.csv_path).exists()
+                    self._csv_file = open(self.csv_path, "a", encoding="utf-8", newline="")
+                    self._csv_writer = csv.writer(self._csv_file)
+                    if is_new:
+                        self._csv_writer.writerow(["ID", "Account", "Password", "Date"])
+                
+                self._csv_writer.writerow([self._next_id, email, password, datetime.now().strftime("%Y-%m-%d")])
+                # The CSV is the only copy of registered passwords, don't
+                # leave rows sitting in the buffer
+                self._csv_file.flush()
+                self._next_id += 1
+                logger.info("Appended account to CSV: %s", email)
+                return True
+            except Exception as e:
+                logger.error("Failed to append to CSV: %s", e)
+                return False
+    
+    async def close(self) -> None:
+        """Write any pending upserts to accounts.json and close the CSV."""
+        async with self._lock:
+            if self._dirty:
+                self._flush()
+            if self._csv_file is not None:
+                self._csv_file.close()
+                self._csv_file = None
+                self._csv_writer = None
+    
+    @staticmethod
+    def _backup_damaged(json_path: str) -> None:
+        """
+        Move a damaged accounts.json aside before starting with no accounts.
+        
+        Raises:
+            OSError: If the file cannot be moved, so it is never overwritten
+        """
+        backup_path = f"{json_path}.bak"
+        try:
+            os.replace(json_path, backup_path)
+        except OSError as e:
+            logger.error("Could not back up %s to %s: %s", json_path, backup_path, e)
+            raise
+        logger.warning("Moved damaged %s to %s, starting with no accounts", json_path, backup_path)
     
-    write_json_file(json_path, accounts)
+    def _flush(self) -> None:
+        write_json_file(self.json_path, [*self._accounts.values(), *self._unkeyed])
+        self._dirty = 0